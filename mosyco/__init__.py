@@ -1,29 +1,38 @@
 # -*- coding: utf-8 -*-
 """
 This package contains the mosyco prototype.
+
+The components are only imported once a Mosyco instance is created, so that
+the command line interface starts quickly. In particular, the GUI dependencies
+are only imported in GUI-mode, and matplotlib only in GUI-mode or headless
+mode.
 """
 
 import multiprocessing as mp
 from queue import Queue
 
-from mosyco.reader import Reader
-from mosyco.plotter import Plotter
-from mosyco.inspector import Inspector
+from mosyco.queues import OverflowQueue
 
 
 class Mosyco():
     """Represents an instance of the Model-System-Controller Prototype.
 
     The Mosyco architecture combines Reader and Inspector to simulate the live
-    observation of a running system.
+    observation of a running system. With multiple shards, the systems are
+    spread across processes, each with a Mosyco instance of its own (see
+    mosyco.sharding).
 
     Attributes:
         args: command line arguments
-        reader_queue: Queue for communication between reader and inspector
-        plotting_queue: Queue for communication between inspector and plotter
-        reader: mosyco.Reader instance
+        reader_queue: bounded Queue for communication between reader and inspector
+        plot_channel: shared memory and bounded Queue for communication between
+            inspector and plotter (see mosyco.ringbuffer)
+        reader: mosyco.Reader instance (or mosyco.sources.FanIn for multiple sources)
         inspector: mosyco.Inspector instance
-        plotter: mosyco.Plotter instance if GUI-mode is enabled
+        model_data: model data for the asyncio runtime, which creates its own
+            sources and inspector (see mosyco.runtime)
+        plotter: mosyco.Plotter instance if GUI-mode is enabled, or
+            mosyco.Renderer instance in headless mode
     """
 
     def __init__(self, args):
@@ -33,17 +42,42 @@ class Mosyco():
             args: The command line arguments from mosyco.parser
         """
         self.args = args
-        reader_queue = Queue()
+        self.reader_queue = OverflowQueue(Queue(maxsize=args.queue_size),
+                                          args.queue_policy)
+
+        if args.shards > 1:
+            # the shards create their own components when they are run
+            return
+
+        if args.gui or args.render:
+            from mosyco.ringbuffer import PlotChannel
 
-        if args.gui:
-            plotting_queue = mp.Queue()
-            self.plotter = Plotter(self.args, plotting_queue)
+            plot_channel = PlotChannel(
+                OverflowQueue(mp.Queue(maxsize=args.plot_queue_size),
+                              args.plot_queue_policy))
+            if args.gui:
+                from mosyco.plotter import Plotter
+                self.plotter = Plotter(self.args, plot_channel)
+            else:
+                from mosyco.renderer import Renderer
+                self.plotter = Renderer(self.args, plot_channel)
         else:
-            self.reader = Reader(args.systems, reader_queue)
-            self.inspector = Inspector(self.reader.df.index.copy(),
-                                        self.reader.df[args.models],
+            import mosyco.helpers as helpers
+
+            model_data = helpers.load_columns(args.models, args.chunk_size)
+            if args.runtime == 'asyncio':
+                # the runtime creates its sources and inspector when it is run
+                self.model_data = model_data
+                return
+
+            from mosyco.sources import create_reader
+            from mosyco.inspector import Inspector
+
+            self.reader = create_reader(args, self.reader_queue)
+            self.inspector = Inspector(model_data.index.copy(),
+                                        model_data,
                                         self.args,
-                                        reader_queue,
+                                        self.reader_queue,
                                         None)
 
 
@@ -51,8 +85,15 @@ class Mosyco():
         """Start and run the Mosyco system."""
 
         # Either start Inspector thread from GUI or manually
-        if self.args.gui:
+        if self.args.shards > 1:
+            import mosyco.sharding as sharding
+            sharding.run(self.args)
+        elif self.args.gui or self.args.render:
             self.plotter.run()
+        elif self.args.runtime == 'asyncio':
+            import mosyco.runtime as runtime
+            self.inspector = runtime.run(self.args, self.model_data)
         else:
             self.reader.start()
             self.inspector.start()
+            self.reader_queue.report('Reader')
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+This module reports where the startup time of mosyco goes.
+
+Each target is imported in a fresh interpreter with Python's ``-X importtime``
+option. For every target, the total import time and the packages that take the
+longest to import are printed. Run it from the root mosyco directory with::
+
+    python -m mosyco.benchmark
+"""
+import subprocess
+import sys
+from collections import defaultdict
+
+# (label, interpreter arguments) of the measured targets
+targets = [
+    ('mosyco --help', ['-m', 'mosyco', '--help']),
+    ('mosyco', ['-c', 'import mosyco']),
+    ('mosyco.reader', ['-c', 'import mosyco.reader']),
+    ('mosyco.inspector', ['-c', 'import mosyco.inspector']),
+    ('mosyco.plotter', ['-c', 'import mosyco.plotter']),
+    ('mosyco.renderer', ['-c', 'import mosyco.renderer']),
+    ('fbprophet', ['-c', 'import fbprophet']),
+]
+
+
+def import_times(arguments):
+    """Return the import times of all modules imported by a new interpreter.
+
+    Args:
+        arguments (list): arguments for the interpreter, e.g. ['-c', 'import x'].
+
+    Returns:
+        A list of (module, self, cumulative) tuples with the times in
+        microseconds, or None if the interpreter failed.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + arguments,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    if proc.returncode != 0:
+        return None
+
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        (own, cumulative, name) = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(own), int(cumulative)))
+    return times
+
+def report(label, arguments, top=8):
+    """Print the total import time of a target and the slowest packages.
+
+    The time of each package is the sum of the self times of its modules.
+    """
+    times = import_times(arguments)
+    if times is None:
+        print(f'{label}: failed (not installed?)\n')
+        return
+
+    packages = defaultdict(int)
+    for (name, own, _) in times:
+        packages[name.split('.')[0]] += own
+    total = sum(packages.values())
+    print(f'{label}: {total / 1e6:.3f}s in {len(times)} modules')
+
+    slowest = sorted(packages.items(), key=lambda p: p[1], reverse=True)
+    for (package, own) in slowest[:top]:
+        print(f'    {own / 1e6:8.3f}s  {package}')
+    print()
+
+def main():
+    for (label, arguments) in targets:
+        report(label, arguments)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the on-disk cache of the inspector's forecasts.
+
+Reruns, replays of the same data and runs that only differ in the threshold
+fit exactly the same forecasts again. The ForecastCache stores each forecast
+in a file named after a fingerprint of everything the fit depends on: the
+observed training data, the system, the forecasting backend and its
+configuration, the warm start parameters and the forecast period. A later fit
+with the same fingerprint loads the stored forecast instead of fitting.
+
+The cache directory may be shared by any number of processes, e.g. the
+forecasting workers of multiple shards. Entries are written atomically, and
+once the cache grows beyond its size limit, the least recently used entries
+are removed.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# the default location and size limit of the cache
+default_directory = os.path.join('data', '.cache', 'forecasts')
+default_size = 256 * 2**20
+
+# changing the format of the entries invalidates all existing entries
+version = 1
+
+
+def create_cache(args):
+    """Return the ForecastCache selected on the command line, or None."""
+    if not args.forecast_cache:
+        return None
+    return ForecastCache(default_directory, args.forecast_cache_size * 2**20)
+
+
+class ForecastCache:
+    """An on-disk LRU cache of forecast results.
+
+    Each entry is a pickle file named after its key. Reading an entry updates
+    its modification time, which is used to find the least recently used
+    entries. The cache only holds a directory name and a size limit, so it
+    can be sent to worker processes.
+
+    Attributes:
+        directory (str): directory of the entries.
+        max_bytes (int): maximum total size of the entries.
+    """
+    suffix = '.pkl'
+
+    def __init__(self, directory=default_directory, max_bytes=default_size):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(system, period, history, dates, config):
+        """Return the fingerprint of a forecast.
+
+        Args:
+            system (str): name of the actual system.
+            period (Period): the forecast period.
+            history (DataFrame): 'ds' and 'y' columns of the training data.
+            dates (ndarray): datetime64 dates to forecast.
+            config: picklable configuration of the forecaster, e.g. its
+                backend, parameters and warm start values.
+
+        Returns:
+            The key as a string of hex digits.
+        """
+        sha = hashlib.sha1()
+        sha.update(pickle.dumps((version, system, str(period), config), protocol=4))
+        for array in (history['ds'], history['y'], dates):
+            sha.update(np.ascontiguousarray(array).view(np.uint8))
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """Return the cached value of key, or None if there is none."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            log.warning(f'Could not read cached forecast {path}: {e}')
+            return None
+        return value
+
+    def put(self, key, value):
+        """Store a value under key and evict entries if the cache is too big."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # write to a temporary file first, so that readers never see a
+            # partial entry
+            (fd, temp) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=4)
+            os.replace(temp, self._path(key))
+            self.evict()
+        except OSError as e:
+            log.warning(f'Could not cache forecast in {self.directory}: {e}')
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # another process has removed it in the meantime
+                pass
+            total -= size
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the plotting logic shared by GUI-mode and headless mode.
+
+The Dashboard draws the model, the actual system data and the forecasts of a
+single system onto a matplotlib Figure. It does not depend on a particular
+backend: the Plotter shows the figure in a Qt window (see mosyco.plotter),
+while the Renderer writes it to disk with the Agg backend (see
+mosyco.renderer). In both modes, the inspection runs in a process of its own,
+which sends its data through a PlotChannel (see mosyco.ringbuffer).
+"""
+import matplotlib
+import matplotlib.dates
+import matplotlib.style
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.gridspec import GridSpec
+
+import logging
+import time
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from queue import Empty, Queue
+
+from collections import deque
+
+from mosyco.sources import create_reader
+from mosyco.inspector import Inspector
+from mosyco.queues import OverflowQueue
+from mosyco.store import WeeklyAggregator
+import mosyco.helpers as helpers
+import mosyco.methods as methods
+
+log = logging.getLogger(__name__)
+
+def run_mosyco(args, plot_channel):
+    """Start the Mosyco Prototype"""
+    model_data = helpers.load_columns(args.models, args.chunk_size)
+    if args.runtime == 'asyncio':
+        import mosyco.runtime as runtime
+        runtime.run(args, model_data, plot_channel)
+    else:
+        reader_queue = OverflowQueue(Queue(maxsize=args.queue_size),
+                                     args.queue_policy)
+        reader = create_reader(args, reader_queue)
+        inspector = Inspector(model_data.index.copy(),
+                                    model_data,
+                                    args,
+                                    reader_queue,
+                                    plot_channel)
+        reader.start()
+        inspector.start()
+        reader_queue.report('Reader')
+
+    # the plotter does not wait for a final None, so the last coalesced
+    # forecast has to be put explicitly
+    plot_channel.queue.finish()
+    plot_channel.queue.report('Plotting')
+
+class Dashboard:
+    """The Dashboard draws the Mosyco data onto a matplotlib Figure.
+
+    Attributes:
+        args: Command Line Arguments
+        system_name: Name of the actual system
+        model_name: Model name
+        plot_channel: PlotChannel used for communicating with Inspector
+        model_data: DataFrame containing the model data
+        weekly: WeeklyAggregator of the actual system data
+        weeks_shown: Number of most recent weeks of actual data to plot
+        half_period_length: Period / 2
+        paused: Whether or not new data is received
+        update_legend: If the deviation still needs to be added to the legend
+        redraw: If anything but the animated artists has changed since the
+            last frame, i.e. the legend or the forecasts
+        artists: list of artist items that change with each frame
+        fig: Figure object
+        ax1: Top Axes object (System View)
+        ax2: Bottom Axes object (Forecast View)
+        fc_artists: Deque of (line, interval, deviation below, deviation above)
+            artists of the most recent forecasts
+        forecasts_shown: Maximum number of forecasts to draw
+        leg_dict: Legend dictionary
+        legend: Legend object
+        frames: Generator of the updates for each frame, see get_data
+        drain_budget: Maximum seconds to spend on receiving data per frame
+        rs_model: Resampled version of model data
+
+    """
+    # about as many weeks as the 400 days plotted before weekly aggregation
+    weeks_shown = 57
+    forecasts_shown = 4
+    # maximum seconds to spend on receiving data per frame
+    drain_budget = 0.02
+
+    def __init__(self, args, plot_channel):
+        self.args = args
+        # there is only one model & system in GUI mode
+        self.system_name = args.systems[0]
+        self.model_name = args.models[0]
+        self.plot_channel = plot_channel
+
+        # model series
+        temp_df = helpers.load_columns(args.models, args.chunk_size)
+        self.model_data = temp_df[args.models].copy()
+
+        # weekly means of the actual system data
+        self.weekly = WeeklyAggregator()
+
+
+        # TODO: get this from somewhere or leave as default
+        # this needs to be half the period b/c we need to divide it later
+        # and relativedeltas can not always be divided but always multiplied
+        self.half_period_length = relativedelta(months=6)
+        self.deviation_count = 0
+        self.artists = []
+        self.paused = False
+        self.update_legend = True
+        self.redraw = False
+        self.prepare_plot()
+        self.frames = self.get_data()
+
+
+    def prepare_plot(self):
+        """Prepare drawable objects for the animation."""
+
+        matplotlib.style.use('seaborn')
+
+        # create figure and axes objects
+        self.fig = Figure(tight_layout=True)
+        gs = GridSpec(3, 1, height_ratios=[1, 4, 4])
+        self.ax1 = self.fig.add_subplot(gs[1])
+        self.ax2 = self.fig.add_subplot(gs[2], sharex=self.ax1)
+
+
+        self.ax1.set_title('System View')
+        self.ax2.set_title('Forecast View')
+
+        self.ax1.set_ylabel('Units')
+        self.ax2.set_ylabel('Units')
+
+        # actual system lines
+        (self.acl1, ) = self.ax1.plot([], [], c='blue', ls='solid', lw=0.7)
+        (self.acl2, ) = self.ax2.plot([], [], c='blue', ls='solid', lw=0.7)
+
+        # persistent Model-Actual deviation areas, updated in place
+        self.actual_dev_below = area(self.ax1, color='red', alpha=0.3)
+        self.actual_dev_above = area(self.ax1, color='red', alpha=0.3)
+
+        # artists of the forecasts, which are recycled
+        self.fc_artists = deque()
+
+        # plot model w/ standard confidence interval
+        self.plot_model()
+
+        # add lines and areas to artist list
+        self.artists.extend([self.acl1, self.acl2, self.actual_dev_below,
+                             self.actual_dev_above])
+
+        # TODO: set lim automatically
+        self.ax1.set_ylim(800, 1300)
+        self.ax2.set_ylim(800, 1300)
+
+        self.ax1.set_autoscaley_on(True)
+        self.ax2.set_autoscaley_on(True)
+
+        # prepare initial limits for the x-axes
+        start_date = self.model_data.index[0]
+        self.ax1.set_xlim(start_date, start_date
+                          + self.half_period_length * 2)
+        # self.ax2.set_xlim(start_date, start_date
+        #                   + self.half_period_length * 4)
+
+        # add the legends
+        self.leg_dict = {
+            'Live System': self.acl1,
+            'Model': self.m_line1,
+            'Model Threshold': self.model_error,
+        }
+        l = (self.leg_dict.values(), self.leg_dict.keys())
+        self.legend = self.fig.legend(*l, loc='upper center',
+                                        ncol=3, mode='expand')
+
+        # rotate tick labels for all subplots
+        self.fig.autofmt_xdate(bottom=0.2)
+
+    def plot_model(self):
+        """Plot the static model data."""
+
+        # add upper and lower bounds w/ standard threshold
+        # TODO: make variable threshold possible
+        md = self.model_data[self.model_name]
+        self.model_data['upper_bound'] = md + self.args.threshold * md
+        self.model_data['lower_bound'] = md - self.args.threshold * md
+
+        # save a resampled version of the model data
+        self.rs_model = self.model_data.resample('W').mean()
+        rs_md = self.rs_model[self.model_name]
+
+        # model resampled
+        (self.m_line1, ) = self.ax1.plot(
+            rs_md.index,
+            rs_md.values,
+            c='green',
+            ls='solid',
+            lw=0.7,
+            alpha=0.7,
+            )
+
+        # plot the resampled model line
+        (self.m_line2, ) = self.ax2.plot(
+            rs_md.index,
+            rs_md.values,
+            c='green',
+            ls='solid',
+            lw=0.7,
+            alpha=0.7,
+            )
+
+        # plot the model threshold
+        self.model_error = self.ax1.fill_between(
+            rs_md.index,
+            # rs_md.values - self.args.threshold * rs_md.values,
+            # rs_md.values + self.args.threshold * rs_md.values,
+            rs_md.values - self.args.threshold * rs_md.values,
+            rs_md.values + self.args.threshold * rs_md.values,
+            alpha=0.3,
+            color='green',
+            linestyle=':',
+            )
+
+
+    def get_data(self):
+        """Receive data from the inspector and yield the updates of each frame.
+
+        Each frame receives everything that has arrived since the previous
+        frame, so that the plot always shows the current state, no matter
+        how fast the inspector is. Only the rows that can be read within
+        drain_budget seconds are received, the rest is left for the next
+        frame. Of the forecasts, only the ones that are drawn are received.
+        """
+        while True:
+            while self.paused:
+                yield []
+
+            updates = []
+            deadline = time.perf_counter() + self.drain_budget
+
+            # the rows are read from shared memory, while the queue only
+            # notifies about new forecasts
+            (dates, values) = ([], [])
+            while time.perf_counter() < deadline:
+                (new_dates, new_values) = self.plot_channel.receive_rows()
+                if not len(new_dates):
+                    break
+                dates.append(new_dates)
+                values.append(new_values)
+            if dates:
+                updates.append((np.concatenate(dates), np.concatenate(values)))
+
+            notifications = deque(maxlen=self.forecasts_shown)
+            while time.perf_counter() < deadline:
+                try:
+                    notifications.append(self.plot_channel.queue.get_nowait())
+                except Empty:
+                    break
+            for positions in notifications:
+                fc = self.plot_channel.receive_forecast(positions)
+                if fc is not None:
+                    updates.append(fc)
+
+            yield updates
+
+    def next_frame(self):
+        """Apply the updates of the next frame.
+
+        Returns:
+            The number of updates.
+        """
+        updates = next(self.frames)
+        for obj in updates:
+            self.update(obj)
+        return len(updates)
+
+    def views(self):
+        """Return the limits of all axes."""
+        return (self.ax1.get_xlim(), self.ax1.get_ylim(),
+                self.ax2.get_xlim(), self.ax2.get_ylim())
+
+
+    def update(self, obj):
+        """Determine what object was received and update plot accordingly."""
+        if obj is None:
+            return self.artists
+        elif isinstance(obj, pd.DataFrame):
+            return self.plot_forecast(obj)
+        else:
+            return self.plot_actual(obj)
+
+
+    def plot_actual(self, rows):
+        """This function updates various plot elements.
+
+        It is called in regular interval during the animation loop and is
+        responsible for redrawing the lines and axes."""
+
+        # add new rows to the weekly means, the most recent week is only
+        # plotted once it is complete
+        (index, values) = rows
+        closed = self.weekly.add(index, values[:, 0])
+
+        # last row is current date
+        date = pd.Timestamp(index[-1])
+
+        if closed:
+            # set the new acutal data
+            self.weeks = self.weekly.index[-self.weeks_shown:]
+            self.means = self.weekly.values[-self.weeks_shown:]
+            self.acl1.set_data(self.weeks, self.means)
+            self.acl2.set_data(self.weeks, self.means)
+
+            # plot model-actual errors
+            self.plot_model_actual_deviation()
+
+        # get current upper bound of date axis
+        ax1_right_lim = matplotlib.dates.num2date(self.ax1.get_xlim()[1])
+
+        # calculate center and remove timezone information for comparison
+        ax1_center = ax1_right_lim - self.half_period_length
+        ax1_center = ax1_center.replace(tzinfo=None)
+
+        # set the new x_axis limits
+        if date > ax1_center:
+            self.ax1.set_xlim(date - self.half_period_length, date
+                              + self.half_period_length)
+
+        # adjust y-axis
+        self.ax1.relim(visible_only=True)
+        self.ax2.relim(visible_only=True)
+        self.ax1.autoscale_view(tight=None, scalex=False, scaley=True)
+        self.ax2.autoscale_view(tight=None, scalex=False, scaley=True)
+
+        # return all artists that need to be redrawn
+        return self.artists
+
+
+
+    def plot_forecast(self, fc):
+        """Draw a new forecast.
+
+        At most forecasts_shown forecasts are drawn. Once there are as many,
+        the artists of the oldest forecast are recycled for the new one.
+        """
+
+        # get resampled model data for forecast period
+        rs_m = self.rs_model.loc[fc.index, self.model_name].values
+        x = matplotlib.dates.date2num(fc.index.values)
+        lower = fc['yhat_lower'].values
+        upper = fc['yhat_upper'].values
+
+        if len(self.fc_artists) == self.forecasts_shown:
+            artists = self.fc_artists.popleft()
+        else:
+            artists = self.forecast_artists()
+        (fc_line, fc_error, dev_below, dev_above) = artists
+
+        # draw forecast line and confidence interval
+        fc_line.set_data(fc.index, fc['yhat'].values)
+        fc_error.set_verts(between(x, lower, upper))
+
+        # draw deviation between forecast and model below and above
+        dev_below.set_verts(between(x, lower, rs_m, rs_m < lower))
+        dev_above.set_verts(between(x, upper, rs_m, rs_m > upper))
+
+        self.fc_artists.append(artists)
+
+        if len(self.fc_artists) == 1:
+            # update legend the first time a forecast is drawn
+            d = {'Forecast \u00B1 CI': (fc_line, fc_error), 'Model-Forecast Deviation': dev_above}
+            self.leg_dict.update(d)
+            l = (self.leg_dict.values(), self.leg_dict.keys())
+
+            self.legend.remove()
+            self.legend = self.fig.legend(*l, loc='upper center',
+                                            ncol=3, mode='expand')
+
+        # forecasts are not animated, so the background has to be redrawn
+        self.redraw = True
+        return self.artists
+
+    def forecast_artists(self):
+        """Return a new forecast line, interval and deviation areas."""
+        (fc_line, ) = self.ax2.plot([], [], c='black', ls='dashed', lw=0.5,
+                                    alpha=0.4)
+        fc_error = area(self.ax2, color='orange', alpha=0.2)
+        dev_below = area(self.ax2, color='fuchsia', alpha=0.2)
+        dev_above = area(self.ax2, color='fuchsia', alpha=0.2)
+        return (fc_line, fc_error, dev_below, dev_above)
+
+
+    def plot_model_actual_deviation(self):
+        """Draw the deviation between the model and the actual system."""
+
+        # get resmapled index & upper/lower bounds of model line
+        idx = pd.DatetimeIndex(self.weeks)
+        ml_upper = self.rs_model.loc[idx, 'upper_bound'].values
+        ml_lower = self.rs_model.loc[idx, 'lower_bound'].values
+        ac = self.means
+        x = matplotlib.dates.date2num(self.weeks)
+
+        # update the deviation areas below and above in place
+        self.actual_dev_below.set_verts(between(x, ml_lower, ac, ac < ml_lower))
+        self.actual_dev_above.set_verts(between(x, ml_upper, ac, ac > ml_upper))
+
+        # update the legend when necessary
+        if self.update_legend:
+            self.update_legend = False
+            d = {'Model-System Deviation': self.actual_dev_below}
+            self.leg_dict.update(d)
+            l = (self.leg_dict.values(), self.leg_dict.keys())
+
+            self.legend.remove()
+            self.legend = self.fig.legend(*l, loc='upper center',
+                                            ncol=3, mode='expand')
+            self.redraw = True
+
+
+def area(ax, **kwargs):
+    """Add an empty area to ax, which can be updated with set_verts.
+
+    The keyword arguments are passed to the PolyCollection.
+    """
+    collection = PolyCollection([], linestyle=':', **kwargs)
+    ax.add_collection(collection, autolim=False)
+    return collection
+
+def between(x, y1, y2, where=None):
+    """Return the polygons of the area between two curves.
+
+    The polygons are the same as those of matplotlib's fill_between with
+    interpolate=True, but can be set on an existing PolyCollection.
+
+    Args:
+        x (ndarray): x values as floats, e.g. from matplotlib.dates.date2num.
+        y1, y2 (ndarray): y values of the curves.
+        where (ndarray): boolean mask of the x values to fill between.
+            Defaults to all of them.
+
+    Returns:
+        A list of (n, 2) vertex arrays, one for each contiguous run of where.
+    """
+    (x, y1, y2) = (np.asarray(x, dtype=np.float64), np.asarray(y1, dtype=np.float64),
+                   np.asarray(y2, dtype=np.float64))
+    if where is None:
+        where = np.ones(len(x), dtype=bool)
+    d = y1 - y2
+
+    def crossing(i, j):
+        # point between i and j where the curves intersect
+        t = d[i] / (d[i] - d[j]) if d[i] != d[j] else 0.5
+        return (x[i] + t * (x[j] - x[i]), y1[i] + t * (y1[j] - y1[i]))
+
+    polygons = []
+    for (start, stop) in zip(*methods.runs(where)):
+        (xs, upper, lower) = (list(x[start:stop]), list(y1[start:stop]),
+                              list(y2[start:stop]))
+        if start > 0:
+            (cx, cy) = crossing(start - 1, start)
+            (xs, upper, lower) = ([cx] + xs, [cy] + upper, [cy] + lower)
+        if stop < len(x):
+            (cx, cy) = crossing(stop - 1, stop)
+            (xs, upper, lower) = (xs + [cx], upper + [cy], lower + [cy])
+        polygons.append(np.column_stack([xs + xs[::-1], upper + lower[::-1]]))
+    return polygons
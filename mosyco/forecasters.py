@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the forecasting backends of the inspector.
+
+All backends share the interface of the Forecaster base class: they are fit
+on the observed history of a system and predict a forecast with a confidence
+interval for a range of dates. The forecast has the same 'yhat', 'yhat_lower'
+and 'yhat_upper' columns as a Prophet forecast, so the inspector can evaluate
+it in the same way regardless of the backend.
+
+Besides Prophet, the backends only depend on NumPy. They are far less
+sophisticated than Prophet, but fit in a few milliseconds, which makes them
+suitable for systems that need to be forecast very frequently.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+
+# z-score of the default confidence interval, which is 80% like prophet's
+default_z = 1.2816
+
+# number of days in a year, used for yearly seasonality
+year = 365.25
+
+
+class Forecaster:
+    """Base class for all forecasting backends.
+
+    Subclasses implement fit and predict. Backends that can be warm started
+    from a previous fit also implement params.
+    """
+    name = None
+
+    def fit(self, history, init=None):
+        """Fit the forecaster and return it.
+
+        Args:
+            history (DataFrame): 'ds' and 'y' columns of the actual system data.
+            init (dict): parameters of a previous fit, as returned by params.
+        """
+        raise NotImplementedError
+
+    def predict(self, dates):
+        """Return the forecast for the given dates.
+
+        Args:
+            dates (ndarray): datetime64 dates to forecast.
+
+        Returns:
+            A DataFrame indexed by date with 'yhat', 'yhat_lower' and
+            'yhat_upper' columns.
+        """
+        raise NotImplementedError
+
+    def params(self):
+        """Return the fitted parameters to warm start the next fit, if any."""
+        return None
+
+    @classmethod
+    def prepare(cls):
+        """Import the dependencies of the backend ahead of the first fit."""
+
+    @staticmethod
+    def _observed(history):
+        """Return the dates and values of history without missing values."""
+        ds = np.asarray(history['ds'], dtype='datetime64[ns]')
+        y = np.asarray(history['y'], dtype=np.float64)
+        mask = ~np.isnan(y)
+        return (ds[mask], y[mask])
+
+    @staticmethod
+    def _frame(dates, yhat, width):
+        """Return a forecast DataFrame with an interval of yhat ± width."""
+        return pd.DataFrame({'yhat': yhat,
+                             'yhat_lower': yhat - width,
+                             'yhat_upper': yhat + width},
+                            index=pd.DatetimeIndex(dates, name='ds'))
+
+
+class ProphetForecaster(Forecaster):
+    """Forecasts with `fbprophet <https://facebook.github.io/prophet/>`_.
+
+    Prophet is only imported when the first model is fit, because importing
+    it (and PyStan) takes several seconds.
+
+    Releases of prophet before 0.5 do not accept initial values for the fit.
+    With those, the first warm start logs a warning, and all fits of the
+    process start from scratch.
+    """
+    name = 'prophet'
+    # whether prophet accepts initial values, None until it has been tried
+    warm_starts = None
+
+    @classmethod
+    def prepare(cls):
+        # importing prophet (and PyStan) takes several seconds
+        import fbprophet
+
+    def fit(self, history, init=None):
+        from fbprophet import Prophet
+
+        # No custom settings for model --> forecast is just for illustration
+        self.model = Prophet()
+        if init is None or ProphetForecaster.warm_starts is False:
+            self.model.fit(history)
+            return self
+
+        try:
+            self.model.fit(history, init=init)
+            ProphetForecaster.warm_starts = True
+        except TypeError:
+            # older versions of prophet do not accept initial values
+            log.warning('Prophet does not support warm starts. '
+                        'Fitting from scratch.')
+            ProphetForecaster.warm_starts = False
+            self.model = Prophet().fit(history)
+        return self
+
+    def predict(self, dates):
+        forecast = self.model.predict(pd.DataFrame({'ds': dates}))
+
+        # forecast needs to have DateTimeIndex
+        forecast.set_index('ds', inplace=True)
+        return forecast
+
+    def params(self):
+        params = self.model.params
+        init = {name: params[name][0][0] for name in ['k', 'm', 'sigma_obs']}
+        init.update({name: params[name][0] for name in ['delta', 'beta']})
+        return init
+
+
+class SeasonalNaive(Forecaster):
+    """Repeats the values of the most recent season.
+
+    The interval is based on the standard deviation of the differences
+    between consecutive seasons and widens with each season ahead.
+
+    Attributes:
+        season (int): length of a season in rows.
+    """
+    name = 'naive'
+
+    def __init__(self, season=365):
+        self.season = season
+
+    def fit(self, history, init=None):
+        (ds, y) = self._observed(history)
+        self.step = np.median(np.diff(ds)) if len(ds) > 1 else np.timedelta64(1, 'D')
+        self.last = ds[-1]
+
+        # use the whole history as a season if it is shorter than one
+        self.season = min(self.season, len(y))
+        self.values = y[-self.season:]
+
+        diffs = y[self.season:] - y[:-self.season]
+        self.sigma = np.std(diffs) if len(diffs) else np.std(y)
+        return self
+
+    def predict(self, dates):
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        steps = np.rint((dates - self.last) / self.step).astype(int)
+        steps = np.maximum(steps, 1)
+
+        yhat = self.values[(steps - 1) % self.season]
+        seasons_ahead = (steps - 1) // self.season + 1
+        return self._frame(dates, yhat, default_z * self.sigma * np.sqrt(seasons_ahead))
+
+
+class HoltWinters(Forecaster):
+    """Additive Holt-Winters exponential smoothing.
+
+    The smoothing parameters are fixed, so fitting is a single pass over the
+    history. The interval is based on the standard deviation of the one step
+    ahead errors.
+
+    A warm started fit resumes the pass from the components of the previous
+    fit, so only the rows that have been observed since are smoothed. The
+    result is the same as that of a fit from scratch on all rows since the
+    start of the previous fit's history, even if the history is a window.
+
+    Attributes:
+        season (int): length of a season in rows.
+        alpha (float): smoothing parameter of the level.
+        beta (float): smoothing parameter of the trend.
+        gamma (float): smoothing parameter of the seasonal component.
+    """
+    name = 'holt-winters'
+
+    def __init__(self, season=365, alpha=0.2, beta=0.01, gamma=0.1):
+        self.season = season
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+
+    def fit(self, history, init=None):
+        (ds, y) = self._observed(history)
+        self.step = np.median(np.diff(ds)) if len(ds) > 1 else np.timedelta64(1, 'D')
+
+        start = self._resume(ds, init)
+        if start is None:
+            # initialize the components from the first (two) seasons
+            m = self.season = min(self.season, len(y))
+            level = y[:m].mean()
+            trend = (y[m:2 * m].mean() - level) / m if len(y) >= 2 * m else 0.0
+            seasonal = list(y[:m] - level)
+            (start, end) = (m, m)
+            # count, mean and sum of squared differences of the errors
+            errors = (0, 0.0, 0.0)
+        else:
+            m = self.season
+            (level, trend) = (init['level'], init['trend'])
+            seasonal = list(init['seasonal'])
+            end = init['end']
+            errors = init['errors']
+
+        (alpha, beta, gamma) = (self.alpha, self.beta, self.gamma)
+        (count, mean, m2) = errors
+        for (t, value) in enumerate(y[start:].tolist(), end):
+            s = seasonal[t % m]
+            error = value - (level + trend + s)
+            count += 1
+            delta = error - mean
+            mean += delta / count
+            m2 += delta * (error - mean)
+            previous = level
+            level = alpha * (value - s) + (1 - alpha) * (level + trend)
+            trend = beta * (level - previous) + (1 - beta) * trend
+            seasonal[t % m] = gamma * (value - level) + (1 - gamma) * s
+
+        self.last = ds[-1]
+        self.level = level
+        self.trend = trend
+        self.seasonal = np.array(seasonal)
+        self.end = end + len(y) - start
+        self.errors = (count, mean, m2)
+        self.sigma = np.sqrt(m2 / count) if count else np.std(y)
+        return self
+
+    def _resume(self, ds, init):
+        """Return the position to resume a warm started fit at, or None.
+
+        A fit can only be resumed if its components were initialized from two
+        full seasons, like those of any longer history, and if its last date
+        is part of the history.
+        """
+        if (not init or init['season'] != self.season
+                or init['end'] < 2 * self.season):
+            return None
+        start = int(np.searchsorted(ds, init['last'], side='right'))
+        if start == 0 or ds[start - 1] != init['last']:
+            return None
+        return start
+
+    def params(self):
+        return {'season': self.season, 'last': self.last, 'level': self.level,
+                'trend': self.trend, 'seasonal': self.seasonal.copy(),
+                'end': self.end, 'errors': self.errors}
+
+    def predict(self, dates):
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        steps = np.rint((dates - self.last) / self.step).astype(int)
+        steps = np.maximum(steps, 1)
+
+        yhat = (self.level + steps * self.trend
+                + self.seasonal[(self.end + steps - 1) % self.season])
+        return self._frame(dates, yhat, default_z * self.sigma)
+
+
+class RollingRegression(Forecaster):
+    """Linear regression on a rolling window of the most recent history.
+
+    The regressors are a linear trend and the first few harmonics of a yearly
+    seasonality. The interval is based on the standard deviation of the
+    residuals.
+
+    A warm started fit updates the normal equations of the previous window
+    with the rows that have entered and left the window since, instead of
+    building them from the whole window again. It keeps the trend's origin
+    of the first fit.
+
+    Attributes:
+        window (int): number of most recent rows to fit on.
+        harmonics (int): number of yearly fourier terms.
+    """
+    name = 'regression'
+
+    def __init__(self, window=730, harmonics=3):
+        self.window = window
+        self.harmonics = harmonics
+
+    def _features(self, dates):
+        """Return the design matrix for the given dates."""
+        days = (dates - np.datetime64('1970-01-01', 'ns')) / np.timedelta64(1, 'D')
+        columns = [np.ones_like(days), days - self.origin]
+        for k in range(1, self.harmonics + 1):
+            phase = 2 * np.pi * k * days / year
+            columns.extend([np.sin(phase), np.cos(phase)])
+        return np.column_stack(columns)
+
+    def fit(self, history, init=None):
+        (ds, y) = self._observed(history)
+        if self._resume(ds, y, init):
+            return self
+        (ds, y) = (ds[-self.window:], y[-self.window:])
+
+        # center the trend on the window to keep the problem well conditioned
+        self.origin = (ds[-1] - np.datetime64('1970-01-01', 'ns')) / np.timedelta64(1, 'D')
+
+        X = self._features(ds)
+        (self.coef, *_) = np.linalg.lstsq(X, y, rcond=-1)
+        self.sigma = np.std(y - X @ self.coef)
+
+        # the normal equations of the window, for the next warm start
+        (self.first, self.last, self.count) = (ds[0], ds[-1], len(y))
+        (self.xtx, self.xty, self.yy) = (X.T @ X, X.T @ y, y @ y)
+        return self
+
+    def _resume(self, ds, y, init):
+        """Fit by updating the normal equations of a previous fit.
+
+        Returns:
+            False if the previous window is not part of the history, so that
+            the forecaster has to be fit from scratch.
+        """
+        if not init:
+            return False
+        (a, b) = (int(np.searchsorted(ds, init['first'])),
+                  int(np.searchsorted(ds, init['last'], side='right')))
+        if (b - a != init['count'] or not b
+                or ds[a] != init['first'] or ds[b - 1] != init['last']):
+            return False
+
+        # the rows that have entered and left the window since
+        (c, d) = (max(0, len(y) - self.window), len(y))
+        added = np.r_[c:min(a, d), max(b, c):d]
+        removed = np.r_[a:min(b, c)]
+
+        self.origin = init['origin']
+        (Xa, Xr) = (self._features(ds[added]), self._features(ds[removed]))
+        self.xtx = init['xtx'] + Xa.T @ Xa - Xr.T @ Xr
+        self.xty = init['xty'] + Xa.T @ y[added] - Xr.T @ y[removed]
+        self.yy = init['yy'] + y[added] @ y[added] - y[removed] @ y[removed]
+        (self.first, self.last, self.count) = (ds[c], ds[-1], d - c)
+
+        try:
+            self.coef = np.linalg.solve(self.xtx, self.xty)
+        except np.linalg.LinAlgError:
+            return False
+        # the residuals of a fit with an intercept have a mean of zero
+        rss = self.yy - 2 * self.coef @ self.xty + self.coef @ self.xtx @ self.coef
+        self.sigma = np.sqrt(max(rss, 0) / self.count)
+        return True
+
+    def params(self):
+        return {'origin': self.origin, 'first': self.first, 'last': self.last,
+                'count': self.count, 'xtx': self.xtx, 'xty': self.xty,
+                'yy': self.yy}
+
+    def predict(self, dates):
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        yhat = self._features(dates) @ self.coef
+        return self._frame(dates, yhat, default_z * self.sigma)
+
+
+# available backends by name
+backends = {cls.name: cls for cls in [ProphetForecaster, SeasonalNaive,
+                                      HoltWinters, RollingRegression]}
+
+
+def create(name):
+    """Return a new forecaster for the backend with the given name."""
+    try:
+        return backends[name]()
+    except KeyError:
+        raise ValueError(f"Unknown forecaster: {name}")
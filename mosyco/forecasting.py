@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""
+This module runs the inspector's forecasts in the background.
+
+Fitting a forecasting model is by far the most expensive operation of the
+inspector. The ForecastPool sends each fit to a pool of worker processes, so
+that the inspector can keep evaluating new system data at full rate in the
+meantime and forecasts for multiple systems are computed in parallel.
+
+The AsyncForecastPool does the same for the asyncio runtime, see
+mosyco.runtime.
+
+Both pools can look up the forecasts in a ForecastCache before fitting them,
+see mosyco.cache. The lookup is done by the workers as well.
+
+Starting a worker process takes a few seconds, so both pools start their
+workers before any data arrives. While all workers are busy, submitted
+forecasts wait in a bounded queue. Submitting never blocks the inspector: once
+the queue is full, further forecasts are skipped until it has room again.
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from queue import Empty, Full, Queue
+
+import mosyco.forecasters as forecasters
+import mosyco.helpers as helpers
+
+log = logging.getLogger(__name__)
+
+
+def fit_forecast(history, dates, init=None, backend='prophet', cache=None,
+                 system=None, period=None):
+    """Fit a forecasting model and return its forecast for the given dates.
+
+    This function is executed in the worker processes.
+
+    If the parameters of a previous fit are given, the optimization is warm
+    started from them. Since the parameters usually change very little between
+    two consecutive fits, this saves most of the optimizer's iterations.
+
+    If a cache is given and holds the same forecast, nothing is fit at all.
+
+    Args:
+        history (DataFrame): 'ds' and 'y' columns of the actual system data.
+        dates (ndarray): datetime64 dates to forecast.
+        init (dict): parameters of a previous fit, see Forecaster.params.
+        backend (str): name of the forecasting backend.
+        cache (ForecastCache): cache of previous forecasts, if any.
+        system (str): name of the actual system, part of the cache key.
+        period (Period): the forecast period, part of the cache key.
+
+    Returns:
+        A tuple of the forecast, the fitted parameters, the duration of the
+        fit (or lookup) in seconds and whether the forecast was cached. The
+        forecast is a DataFrame indexed by date with 'yhat', 'yhat_lower' and
+        'yhat_upper' columns (among others).
+    """
+    started = time.perf_counter()
+    forecaster = forecasters.create(backend)
+
+    if cache is not None:
+        # the configuration of a new forecaster is its constructor arguments.
+        # The warm start parameters are not part of it: they depend on which
+        # previous fits happened to be merged before the forecast was
+        # submitted, and only speed up the fit.
+        config = (backend, vars(forecaster))
+        key = cache.key(system, period, history, dates, config)
+        cached = cache.get(key)
+        if cached is not None:
+            (forecast, params) = cached
+            return (forecast, params, time.perf_counter() - started, True)
+
+    # silence suppresses stdout (to deal with pystan bug)
+    with helpers.silence():
+        forecaster.fit(history, init)
+        seconds = time.perf_counter() - started
+
+        forecast = forecaster.predict(dates)
+
+    params = forecaster.params()
+    if cache is not None:
+        cache.put(key, (forecast, params))
+    return (forecast, params, seconds, False)
+
+
+def warm_up(backend='prophet'):
+    """Prepare a worker process for fitting forecasts with a backend.
+
+    Returns:
+        The process id of the worker.
+    """
+    forecasters.backends[backend].prepare()
+    return os.getpid()
+
+def create_executor(workers, backend='prophet', timeout=60):
+    """Return a new pool of worker processes, once all of them have started.
+
+    Args:
+        workers (int): number of worker processes. Defaults to the number
+            of CPUs.
+        backend (str): name of the forecasting backend to prepare.
+        timeout (float): maximum seconds to wait for the workers.
+    """
+    # spawn fresh workers, since forking a threaded process is unsafe.
+    # Before Python 3.7, the pool always uses the default start method.
+    options = {}
+    if sys.version_info >= (3, 7):
+        options['mp_context'] = mp.get_context('spawn')
+    executor = ProcessPoolExecutor(max_workers=workers, **options)
+    started = time.perf_counter()
+    futures = [executor.submit(warm_up, backend)
+               for _ in range(workers or os.cpu_count())]
+    (done, pending) = wait(futures, timeout)
+    failed = [future for future in done if future.exception() is not None]
+    if failed or pending:
+        log.warning(f'{len(failed) + len(pending)} of {len(futures)} forecast '
+                    'workers could not be prepared in time.')
+    else:
+        log.debug(f'Started {len(futures)} forecast workers in '
+                  f'{time.perf_counter() - started:.2f}s.')
+    return executor
+
+
+Result = namedtuple('Result', ['system', 'period', 'forecast', 'observed',
+                               'params', 'seconds', 'cached'])
+Result.__doc__ = """A finished forecast.
+
+Attributes:
+    system (str): name of the actual system.
+    period (Period): the forecast period.
+    forecast (DataFrame): the forecast, indexed by date.
+    observed (int): number of observed rows when the forecast was submitted.
+    params (dict): fitted parameters, used to warm start the next fit.
+    seconds (float): duration of the fit.
+    cached (bool): whether the forecast was taken from the cache.
+"""
+
+
+class ForecastPool:
+    """Runs forecasts in the background on a pool of worker processes.
+
+    The ForecastPool is a pipeline stage of its own. Forecasts are submitted to
+    a bounded work queue, from which a dispatcher thread hands them to the
+    worker processes. Finished forecasts are put on the results queue.
+    Neither submitting nor collecting forecasts blocks the caller, unless it
+    explicitly waits for the pending forecasts. While the work queue is full,
+    submitted forecasts are skipped.
+
+    With zero workers, forecasts are computed by the dispatcher thread itself.
+    If the worker processes fail, e.g. because one of them crashed, the
+    failed forecasts are logged and new workers are started.
+
+    Attributes:
+        executor (ProcessPoolExecutor): the worker processes, if any.
+        backend (str): name of the forecasting backend.
+        cache (ForecastCache): cache of previous forecasts, if any.
+        jobs (Queue): bounded queue of forecasts waiting to be dispatched.
+        results (Queue): queue of finished forecasts.
+        skipped (int): number of forecasts rejected because the queue was full.
+    """
+    def __init__(self, workers=None, capacity=8, backend='prophet', cache=None):
+        """Create a new ForecastPool and start its workers and dispatcher.
+
+        Args:
+            workers (int): number of worker processes. Defaults to the number
+                of CPUs.
+            capacity (int): maximum number of forecasts waiting to be dispatched.
+            backend (str): name of the forecasting backend.
+            cache (ForecastCache): cache of previous forecasts, if any.
+        """
+        self.workers = workers
+        self.backend = backend
+        if workers == 0:
+            self.executor = None
+            slots = 1
+        else:
+            self.executor = create_executor(workers, backend)
+            slots = workers or os.cpu_count()
+
+        self.cache = cache
+        self.jobs = Queue(maxsize=capacity)
+        self.results = Queue()
+        self.skipped = 0
+
+        # limits the number of forecasts in flight to the number of workers,
+        # so that waiting forecasts stay in the bounded jobs queue
+        self._slots = threading.BoundedSemaphore(slots)
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, system, period, history, dates, observed, init=None):
+        """Submit a new forecast for a system and period.
+
+        Args:
+            system (str): name of the actual system.
+            period (Period): the period to forecast.
+            history (DataFrame): 'ds' and 'y' columns of the actual system data.
+            dates (ndarray): datetime64 dates of the period.
+            observed (int): number of observed rows at the time of submission.
+            init (dict): parameters of a previous fit to warm start from.
+
+        Returns:
+            False if the forecast was rejected because the queue was full.
+        """
+        try:
+            self.jobs.put_nowait((system, period, history, dates, observed,
+                                  init))
+        except Full:
+            self.skipped += 1
+            log.warning(f'Forecast queue is full. Skipped {system} forecast '
+                        f'for {period}.')
+            return False
+        return True
+
+    def _dispatch(self):
+        """Hand the submitted forecasts to the workers until shut down."""
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+
+            self._slots.acquire()
+            (system, period, history, dates, observed, init) = job
+            if self.executor is None:
+                future = Future()
+                try:
+                    future.set_result(fit_forecast(history, dates, init,
+                                                   self.backend, self.cache,
+                                                   system, period))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                try:
+                    future = self.executor.submit(fit_forecast, history, dates,
+                                                  init, self.backend,
+                                                  self.cache, system, period)
+                except Exception as e:
+                    # e.g. BrokenProcessPool, if a worker has died
+                    log.error(f'{system} forecast for {period} failed: {e}')
+                    self._slots.release()
+                    self.jobs.task_done()
+                    self.restart()
+                    continue
+
+            def done(future, system=system, period=period, observed=observed):
+                self._slots.release()
+                try:
+                    (forecast, params, seconds, cached) = future.result()
+                    self.results.put(Result(system, period, forecast, observed,
+                                            params, seconds, cached))
+                except Exception as e:
+                    log.error(f'{system} forecast for {period} failed: {e}')
+                finally:
+                    self.jobs.task_done()
+
+            future.add_done_callback(done)
+
+    def restart(self):
+        """Replace the worker processes with new ones."""
+        log.warning('Restarting the forecast workers.')
+        self.executor.shutdown(wait=False)
+        self.executor = create_executor(self.workers, self.backend)
+
+    def completed(self, wait=False):
+        """Yield a Result for each finished forecast.
+
+        Args:
+            wait (bool): wait until all pending forecasts are finished.
+        """
+        if wait:
+            self.jobs.join()
+
+        while True:
+            try:
+                yield self.results.get_nowait()
+            except Empty:
+                return
+
+    def shutdown(self):
+        """Stop the dispatcher and release the worker processes."""
+        self.jobs.put(None)
+        self._dispatcher.join()
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+class AsyncForecastPool:
+    """Runs forecasts in the background of an asyncio event loop.
+
+    The AsyncForecastPool has the same interface as the ForecastPool, but its
+    dispatcher is a coroutine, which hands the forecasts to the worker
+    processes with run_in_executor. It must be created and used inside the
+    running event loop.
+
+    Like the ForecastPool, it skips the forecasts submitted while capacity
+    forecasts are waiting.
+
+    With zero workers, forecasts are computed by the event loop's default
+    thread pool.
+
+    Attributes:
+        executor (ProcessPoolExecutor): the worker processes, if any.
+        backend (str): name of the forecasting backend.
+        cache (ForecastCache): cache of previous forecasts, if any.
+        jobs (asyncio.Queue): bounded queue of forecasts waiting to be
+            dispatched.
+        results (deque): finished forecasts.
+        skipped (int): number of forecasts rejected because the queue was full.
+    """
+    def __init__(self, workers=None, capacity=8, backend='prophet', cache=None):
+        """Create a new AsyncForecastPool.
+
+        Args:
+            workers (int): number of worker processes. Defaults to the number
+                of CPUs.
+            capacity (int): maximum number of forecasts waiting to be dispatched.
+            backend (str): name of the forecasting backend.
+            cache (ForecastCache): cache of previous forecasts, if any.
+        """
+        self.workers = workers
+        self.backend = backend
+        if workers == 0:
+            self.executor = None
+            slots = 1
+        else:
+            self.executor = create_executor(workers, backend)
+            slots = workers or os.cpu_count()
+
+        self.cache = cache
+        self.jobs = asyncio.Queue(maxsize=capacity)
+        self.results = deque()
+        self.skipped = 0
+        self._slots = asyncio.Semaphore(slots)
+
+    def submit(self, system, period, history, dates, observed, init=None):
+        """Submit a new forecast for a system and period.
+
+        See ForecastPool.submit.
+        """
+        try:
+            self.jobs.put_nowait((system, period, history, dates, observed,
+                                  init))
+        except asyncio.QueueFull:
+            self.skipped += 1
+            log.warning(f'Forecast queue is full. Skipped {system} forecast '
+                        f'for {period}.')
+            return False
+        return True
+
+    async def dispatch(self):
+        """Hand the submitted forecasts to the workers until shut down."""
+        loop = asyncio.get_event_loop()
+        while True:
+            job = await self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+
+            await self._slots.acquire()
+            (system, period, history, dates, observed, init) = job
+            try:
+                future = loop.run_in_executor(self.executor, fit_forecast,
+                                              history, dates, init,
+                                              self.backend, self.cache,
+                                              system, period)
+            except Exception as e:
+                # e.g. BrokenProcessPool, if a worker has died
+                log.error(f'{system} forecast for {period} failed: {e}')
+                self._slots.release()
+                self.jobs.task_done()
+                self.restart()
+                continue
+            future.add_done_callback(functools.partial(
+                self._done, system, period, observed))
+
+    def _done(self, system, period, observed, future):
+        """Collect a finished forecast."""
+        self._slots.release()
+        try:
+            (forecast, params, seconds, cached) = future.result()
+            self.results.append(Result(system, period, forecast, observed,
+                                       params, seconds, cached))
+        except Exception as e:
+            log.error(f'{system} forecast for {period} failed: {e}')
+        finally:
+            self.jobs.task_done()
+
+    def restart(self):
+        """Replace the worker processes with new ones, if any."""
+        if self.executor is None:
+            return
+        log.warning('Restarting the forecast workers.')
+        self.executor.shutdown(wait=False)
+        self.executor = create_executor(self.workers, self.backend)
+
+    async def join(self):
+        """Wait until all pending forecasts are finished."""
+        await self.jobs.join()
+
+    def completed(self, wait=False):
+        """Yield a Result for each finished forecast.
+
+        The event loop can not be blocked while waiting for the pending
+        forecasts, so they have to be awaited with join beforehand.
+
+        Args:
+            wait (bool): ignored, see join.
+        """
+        while self.results:
+            yield self.results.popleft()
+
+    def shutdown(self):
+        """Stop the dispatcher and release the worker processes."""
+        self.jobs.put_nowait(None)
+        if self.executor is not None:
+            self.executor.shutdown()
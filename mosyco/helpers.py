@@ -4,19 +4,219 @@
 import os
 import sys
 import contextlib
+import hashlib
+import json
 import logging
-import pandas as pd
+import shutil
+import tempfile
 
+log = logging.getLogger(__name__)
 
-def load_dataframe():
-    """Load the dataset into memory."""
-    df = pd.read_csv(os.path.join('data/sample_data.csv'),
-                                    index_col=1, parse_dates=True,
-                                    infer_datetime_format=True)
+# the sample data and the directory of its binary cache
+data_file = os.path.join('data', 'sample_data.csv')
+cache_dir = os.path.join('data', '.cache')
+# position of the date column in the CSV files
+index_column = 1
+
+
+def load_dataframe(columns=None, path=data_file):
+    """Load the dataset into memory.
+
+    Parsing the CSV file is slow, so it is converted into a binary cache on
+    the first load. The cache holds the index and a single column-major 2-D
+    array of all columns as .npy files, which are memory-mapped on later
+    loads. The DataFrame of all columns, or of a range of adjacent columns,
+    is a view on the mapped array, any other selection copies only the
+    selected columns. The cache is rebuilt when the contents of the CSV file
+    change.
+
+    Args:
+        columns (list): names of the columns to load. Defaults to all columns.
+        path (str): path of the CSV file. Defaults to the sample data.
+
+    Raises:
+        KeyError: if one of the columns is not in the dataset.
+    """
+    df = _load_cache(path, columns)
+    if df is not None:
+        return df
+
+    df = _read_csv(path)
+    try:
+        _write_cache(path, df)
+    except OSError as e:
+        log.warning(f'Could not cache {path}: {e}')
+
+    if columns is None:
+        return df
+    _check_columns(columns, df.columns)
+    return df[columns]
+
+def load_columns(columns, chunk_size=None):
+    """Load only the given columns of the dataset.
+
+    Args:
+        columns (list): names of the columns to load.
+        chunk_size (int): if given, the columns are parsed from the CSV file
+            in chunks of this many rows instead of using the binary cache.
+    """
+    # models may be shared by several systems, but are only loaded once
+    columns = list(dict.fromkeys(columns))
+    if chunk_size is None:
+        return load_dataframe(columns)
+
+    import pandas as pd
+    return pd.concat(stream_dataframe(columns, chunk_size))
+
+def stream_dataframe(columns, chunk_size, path=data_file):
+    """Yield the given columns of the dataset in chunks of chunk_size rows.
+
+    Only the requested columns are parsed, so memory use is bounded by the
+    chunk size, regardless of the size of the CSV file at path. The index is
+    the same column as that of load_dataframe.
+
+    Raises:
+        KeyError: if one of the columns is not in the dataset.
+    """
+    import pandas as pd
+
+    columns = list(dict.fromkeys(columns))
+    header = pd.read_csv(path, nrows=0).columns
+    _check_columns(columns, header)
+
+    index = header[index_column]
+    chunks = pd.read_csv(path, usecols=[index] + columns, index_col=index,
+                         parse_dates=True, chunksize=chunk_size)
+    for chunk in chunks:
+        yield chunk[columns]
+
+def _check_columns(columns, available):
+    """Raise a KeyError naming the first of columns that is not available."""
+    for name in columns:
+        if name not in available:
+            raise KeyError(f"Unknown column: {name}")
+
+def _read_csv(path):
+    """Parse the CSV file at path into a DataFrame."""
+    # pandas is imported here, so that importing the helpers stays cheap
+    import pandas as pd
+
+    df = pd.read_csv(path, index_col=index_column, parse_dates=True,
+                     infer_datetime_format=True)
     # sanitize dataframe
     df = df.drop(['Unnamed: 0'], axis=1)
     return df
 
+def _cache_path(path):
+    """Return the cache directory for the file at path.
+
+    The directory is named after the file and a hash of its absolute path,
+    so that files of the same name in different directories do not collide.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f'{name}-{digest}')
+
+def _fingerprint(path):
+    """Return the SHA-1 hash of the file at path."""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _write_meta(target, meta):
+    """Atomically write the meta file of a cache directory."""
+    (fd, temp) = tempfile.mkstemp(dir=target, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(meta, f)
+    os.replace(temp, os.path.join(target, 'meta.json'))
+
+def _write_cache(path, df):
+    """Save the index and values of df as .npy files in the cache.
+
+    The files are written to a temporary directory, which then replaces the
+    cache directory, so that other processes (e.g. shards starting at the
+    same time) never read a partial cache.
+    """
+    import numpy as np
+
+    target = _cache_path(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp = tempfile.mkdtemp(dir=cache_dir, suffix='.tmp')
+    try:
+        stat = os.stat(path)
+        np.save(os.path.join(temp, 'index.npy'), df.index.values)
+        np.save(os.path.join(temp, 'values.npy'),
+                np.asfortranarray(df.values, dtype=np.float64))
+
+        # the meta file is written last and marks the cache as complete
+        _write_meta(temp, {'mtime': stat.st_mtime_ns, 'size': stat.st_size,
+                           'sha1': _fingerprint(path), 'index': df.index.name,
+                           'columns': list(df.columns)})
+
+        # a directory can only replace an empty one, so an outdated cache is
+        # moved out of the way first
+        if os.path.exists(target):
+            old = tempfile.mkdtemp(dir=cache_dir, suffix='.old')
+            os.replace(target, os.path.join(old, 'cache'))
+            shutil.rmtree(old, ignore_errors=True)
+        try:
+            os.replace(temp, target)
+        except OSError:
+            if not os.path.exists(target):
+                raise
+            # another process has written the cache in the meantime
+            return
+    finally:
+        shutil.rmtree(temp, ignore_errors=True)
+    log.debug(f'Cached {path} in {target}.')
+
+def _load_cache(path, columns=None):
+    """Return the cached DataFrame for the file at path.
+
+    Return None if there is no valid cache. A cache is valid if the file's
+    modification time and size are unchanged or, failing that, its hash.
+
+    Raises:
+        KeyError: if one of the columns is not in the cache.
+    """
+    import numpy as np
+    import pandas as pd
+
+    target = _cache_path(path)
+    try:
+        with open(os.path.join(target, 'meta.json')) as f:
+            meta = json.load(f)
+        stat = os.stat(path)
+
+        if (meta['mtime'], meta['size']) != (stat.st_mtime_ns, stat.st_size):
+            # the file was touched, check whether its contents changed
+            if meta['sha1'] != _fingerprint(path):
+                return None
+            meta['mtime'] = stat.st_mtime_ns
+            _write_meta(target, meta)
+
+        load = lambda name: np.load(os.path.join(target, name), mmap_mode='r')
+        index = pd.DatetimeIndex(load('index.npy'), name=meta['index'])
+        values = load('values.npy')
+    except (OSError, ValueError):
+        # e.g. the cache is being replaced by another process
+        return None
+
+    if columns is None:
+        columns = meta['columns']
+    _check_columns(columns, meta['columns'])
+    positions = [meta['columns'].index(name) for name in columns]
+
+    # adjacent columns are a view on the mapped array, others are copied
+    first = positions[0] if positions else 0
+    if positions == list(range(first, first + len(positions))):
+        values = values[:, first:first + len(positions)]
+    else:
+        values = values[:, positions]
+    return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
 def setup_logging(args):
     """Setup logging for the application"""
 
@@ -2,12 +2,14 @@
 import numpy as np
 import pandas as pd
 import logging
-import time
-
-from fbprophet import Prophet
+from collections import Counter
 
 import mosyco.methods as methods
 import mosyco.helpers as helpers
+from mosyco.store import ForecastStore, StateStore
+from mosyco.forecasting import ForecastPool
+from mosyco.cache import create_cache
+from mosyco.scheduler import create_scheduler
 
 
 log = logging.getLogger(__name__)
@@ -29,14 +31,32 @@ class Inspector:
 
     Attributes:
         args (Namespace): command line arguments
-        df (DataFrame): holds model data and is filled with actual values.
+        store (StateStore): holds model data and is filled with actual values.
+        df (DataFrame): pandas view on the data held by the store.
         model_map (dict): mapping of systems to models.
-        forecast (DataFrame): is filled with forecasts in regular intervals.
-        plotting_queue (Queue): Queue for plotter-inspector communication.
+        forecasts (ForecastStore): is filled with forecasts in regular
+            intervals, keyed by system and period.
+        pool (ForecastPool): computes the forecasts in the background.
+        scheduler (Scheduler): decides when to forecast which system and period.
+        until (datetime64): date after which the Inspector stops, if any.
+        fitted (dict): number of observed rows each system's latest forecast
+            was fit on.
+        fit_params (dict): each system's latest fitted parameters, used to
+            warm start the next fit.
+        fit_stats (dict): duration in seconds, accuracy (MAPE), whether it
+            was cached and number of vintages of each (system, period)
+            forecast. All but the number of vintages refer to the latest one.
+        deviations (Counter): number of Model-Actual deviations per system.
+        detector (Detector): streaming detector watching the Model-Actual
+            deviations of all systems for drift, if any.
+        alarms (Counter): number of the detector's alarms per system.
+        plot_channel (PlotChannel): sends the data to the plotter in GUI-mode or
+            headless mode.
         reader_queue (Queue): Queue for reader-inspector communication.
         threshold (float): percentage threshold for actual-model deviations.
     """
-    def __init__(self, index, model_columns, args, reader_queue, plotting_queue):
+    def __init__(self, index, model_columns, args, reader_queue, plot_channel,
+                 pool=None):
         """Create a new Inspector.
 
         The index should be the reader's index. This means that the reader and
@@ -45,137 +65,377 @@ class Inspector:
         Args:
             index (Index or DateTimeIndex): of the corresponding reader's dataframe.
             model_columns (Series): list of model data columns, passed from reader in batch.
+            pool (ForecastPool): computes the forecasts. A new ForecastPool
+                is created by default.
         """
         self.args = args
         self.model_map = dict(zip(self.args.systems, self.args.models))
 
-        self.df = pd.DataFrame(data=model_columns.copy(), index=index)
-        for s in self.args.systems:
-            self.df[s] = np.nan
+        self.store = StateStore(index,
+                                list(model_columns.columns) + self.args.systems)
+        for m in model_columns.columns:
+            self.store.set_column(m, model_columns[m].values)
 
         self.reader_queue = reader_queue
-        self.plotting_queue = plotting_queue
-
-        # add 'ds' (Date) column for fbprohet
-        self.df['ds'] = self.df.index
-
-        # add a forecast dataframe with same index as main dataframe
-        self.forecast = pd.DataFrame(index=index)
+        self.plot_channel = plot_channel
+
+        # add a forecast store with same index as the state store
+        self.forecasts = ForecastStore(index)
+        if pool is None:
+            pool = ForecastPool(self.args.workers, self.args.forecast_queue_size,
+                                self.args.forecaster, create_cache(self.args))
+        self.pool = pool
+        self.scheduler = create_scheduler(self.args)
+        self.until = (np.datetime64(pd.Timestamp(self.args.until), 'ns')
+                      if self.args.until else None)
+        self.fitted = {}
+        self.fit_params = {}
+        self.fit_stats = {}
+        self.deviations = Counter()
+        self.detector = None
+        if self.args.detector:
+            self.detector = methods.create_detector(self.args.detector,
+                                                    len(self.args.systems))
+        self.alarms = Counter()
+        # whether each system's latest row raised an alarm
+        self._alarming = np.zeros(len(self.args.systems), dtype=bool)
 
         self.threshold = self.args.threshold
         # \u00B1 is unicode for hte plus-minus character
         log.debug(f"Using threshold: \u00B1{self.threshold:.1%}")
 
+    @property
+    def df(self):
+        """DataFrame view on the model and actual data in the store."""
+        return self.store.frame()
+
     def start(self):
         """Start the Inspector."""
         # silence suppresses stdout (to deal with pystan bug)
         log.info("Starting Inspector...")
         with helpers.silence():
-            for row in self.receive():
-                # sanity check
-                assert len(self.args.systems) == len(row) - 1
-
-                # get date
-                date = row['Index']
-
-                # evaluate system vs model for each system
-                for system_name, val in row.items():
-                    if system_name is not 'Index':
-                        self.eval_actual(date, system_name)
-
-                # at the end of each period, create a forecast for the following
-                if date.month == 12 and date.day == 31:
-                    # create a period for the following year
-                    period = pd.Period(date.year + 1)
-
-                    # stop at this date
-                    if date.year == 2005:
-                        break
-
-                    # generate a forecasts for each system and evaluate it
-                    # against the model data
-                    for system in self.args.systems:
-                        log.debug(f'Generating {system} forecast for {period}...')
-                        self.forecast_period(period, system)
-                        log.debug(f'{system} forecast was generated for {period}.')
-                        log.debug(f'Evaluating {system} forecast for {period}...')
-                        self.eval_future(period, system)
-
-                # if in GUI-Mode, push forecast to plotter
-                if self.args.gui:
-                    self.plotting_queue.put(row)
+            for block in self.receive():
+                if not self.process(block):
+                    break
+            self.finish()
 
         log.info("The Inspector has finished!")
 
+    def process(self, block):
+        """Evaluate a stored block and schedule the forecasts that are due.
+
+        Args:
+            block (Block): Block of actual system data, as yielded by ingest.
+
+        Returns:
+            False if the Inspector should stop, True otherwise.
+        """
+        # sanity check
+        assert set(block.columns) <= set(self.args.systems)
+
+        # blocks are split after the last date, so a block either ends with
+        # it or starts after it
+        if self.until is not None and block.index[0] > self.until:
+            return False
+
+        # evaluate system vs model for all systems at once
+        (exceeds_threshold, _) = self.eval_actual(block)
+        if self.detector is not None:
+            # the forecasts of the drift cadence follow the detector's alarms
+            # rather than the threshold
+            exceeds_threshold = self.detect(block)
+        self.scheduler.observe(block.columns, exceeds_threshold)
+
+        # blocks are split at period ends and wherever a forecast is due,
+        # so only the last date of a block can be one of them
+        date = block.index[-1]
+
+        # score the forecast of the period that has just ended
+        ended = self.scheduler.ended(date)
+        if ended is not None:
+            for system in block.columns:
+                self.score_forecast(ended, system)
+
+        # stop at this date
+        if self.until is not None and date >= self.until:
+            return False
+
+        # schedule the forecasts that are due, each is evaluated
+        # against the model data once it is done
+        for (system, period) in self.scheduler.due(date, self.store.cursor,
+                                                   block.columns, ended):
+            log.debug(f'Generating {system} forecast for {period}...')
+            if not self.forecast_period(period, system):
+                self.scheduler.cancel(system, period)
+
+        # if in GUI-Mode or headless mode, write the rows to the plotter's
+        # shared memory
+        if self.plot_channel is not None:
+            self.plot_channel.send_rows(block.index, block.values)
+
+        # merge and evaluate forecasts that are done in the meantime
+        self.merge_forecasts()
+        return True
+
+    def finish(self):
+        """Wait for the pending forecasts and report on them."""
+        self.merge_forecasts(wait=True)
+        self.pool.shutdown()
+
+        # score all forecasts whose period has been observed, regardless of
+        # whether they were merged before or after the period ended
+        for ((system, period), stats) in self.fit_stats.items():
+            forecast = self.forecasts.get(system, period)
+            if 'mape' not in stats and self.store.cursor >= forecast.stop:
+                self.score_forecast(period, system)
+        self.report_fits()
+        if self.pool.skipped:
+            log.info(f'{self.pool.skipped} forecasts skipped because the '
+                     'forecast queue was full.')
+        self.scheduler.report()
+
+    def merge_forecasts(self, wait=False):
+        """Merge finished forecasts and evaluate them against the model data.
+
+        Args:
+            wait (bool): wait until all pending forecasts are finished.
+        """
+        for result in self.pool.completed(wait):
+            (system, period, new_forecast, observed, params, seconds,
+             cached) = result
+            self.fitted[system] = observed
+            self.fit_params[system] = params
+            self.scheduler.spent(system, period, seconds)
+            source = 'loaded from the cache' if cached else 'generated'
+            log.debug(f'{system} forecast was {source} for {period} in '
+                      f'{seconds:.2f}s, {self.staleness(system)} rows arrived '
+                      'in the meantime.')
+
+            # add it as the latest vintage of the system's period
+            forecast = self.forecasts.add(system, period, new_forecast, observed)
+            self.fit_stats[(system, period)] = {
+                'seconds': seconds, 'cached': cached,
+                'vintages': len(self.forecasts.vintages(system, period))}
+
+            log.debug(f'Evaluating {system} forecast for {period}...')
+            self.eval_future(period, system)
+
+            # the period may have been observed while the forecast was fit
+            if self.store.cursor >= forecast.stop:
+                self.score_forecast(period, system)
+
+
+    def score_forecast(self, period, system):
+        """Calculate the accuracy of a forecast once its period is observed.
+
+        The accuracy is the mean absolute percentage error (MAPE) between the
+        forecast and the actual system data. The MAPE of the latest vintage is
+        saved in fit_stats along with the duration of the fit, the MAPE of
+        earlier vintages is only logged.
+        """
+        stats = self.fit_stats.get((system, period))
+        if stats is None:
+            # the period was not forecast or the forecast is not done yet
+            return
+
+        vintages = self.forecasts.vintages(system, period)
+        if not vintages:
+            return
+        for (i, forecast) in enumerate(vintages):
+            actual = self.store.column(system, forecast.start, forecast.stop)
+            yhat = self.forecasts.column(forecast, 'yhat')
+            mape = np.nanmean(np.abs(yhat - actual) / np.abs(actual))
+            if i < len(vintages) - 1:
+                log.debug(f'{system} forecast for {period} fit on '
+                          f'{forecast.observed} rows: MAPE {mape:.2%}.')
+
+        stats['mape'] = mape
+        log.debug(f'{system} forecast for {period}: '
+                  f'MAPE {stats["mape"]:.2%}, fit took {stats["seconds"]:.2f}s.')
+
+    def report_fits(self):
+        """Log the average duration and accuracy of all forecasts."""
+        if not self.fit_stats:
+            return
+
+        mode = 'warm started' if self.args.warm_start else 'cold'
+        if self.args.fit_window:
+            mode += f', window of {self.args.fit_window} rows'
+        cached = sum(stats['cached'] for stats in self.fit_stats.values())
+        if cached:
+            mode += f', {cached} from the cache'
+
+        vintages = sum(stats['vintages'] for stats in self.fit_stats.values())
+        if vintages > len(self.fit_stats):
+            mode += f', {vintages} vintages'
+
+        seconds = [stats['seconds'] for stats in self.fit_stats.values()]
+        scores = [stats['mape'] for stats in self.fit_stats.values()
+                  if 'mape' in stats]
+        mape = f'{np.mean(scores):.2%}' if scores else 'n/a'
+        log.info(f'{len(seconds)} forecasts ({mode}): '
+                 f'average fit {np.mean(seconds):.2f}s, average MAPE {mape}.')
+
+    def summary(self):
+        """Return the results of the Inspector as a picklable dict.
+
+        The summary holds the deviations, alarms and fit_stats, see
+        Attributes.
+        """
+        return {'deviations': dict(self.deviations),
+                'alarms': dict(self.alarms),
+                'fit_stats': self.fit_stats}
+
+    def staleness(self, system):
+        """Return how far the data has moved since the latest completed fit.
+
+        The staleness is the number of rows that have been observed since the
+        training data for the system's latest completed forecast was taken.
+        Before the first forecast is completed, this is the number of all
+        observed rows.
+        """
+        return self.store.cursor - self.fitted.get(system, 0)
 
     def receive(self):
         """Receive data from the Reader.
 
-        While the Reader pushes new data rows to the reader_queue in a loop,
-        the Inspector receives this data and yields it row by row to the
-        Inspector's start method for evaluation.
+        While the Reader pushes new data blocks to the reader_queue in a loop,
+        the Inspector receives these blocks, stores them in its dataframe and
+        yields them to the Inspector's start method for evaluation.
         """
         while True:
-            try:
-                new_row = self.reader_queue.get(block=True)
+            new_block = self.reader_queue.get(block=True)
 
-                # Signal that reader has finished pushing data
-                if new_row is None:
-                    log.debug('The queue is empty. Shutting down Inspector...')
-                    return
+            # Signal that reader has finished pushing data
+            if new_block is None:
+                log.debug('The queue is empty. Shutting down Inspector...')
+                return
 
-                # prevent pandas error "setting an array element with a sequence"
-                if len(new_row) == 2:
-                    self.df.loc[new_row.Index, self.args.systems] = new_row[1:][0]
-                else:
-                    self.df.loc[new_row.Index, self.args.systems] = new_row[1:]
+            yield from self.ingest(new_block)
 
-                yield new_row._asdict()
+    def ingest(self, block):
+        """Store a received block and yield it for evaluation.
 
-            except Exception as e:
-                log.debug('Exception in mosyco.inspector.receive: {}'.format(e))
-                time.sleep(0.05)
-                continue
+        Blocks are split wherever the Scheduler may schedule a forecast, e.g.
+        after the last day of each year, so that the following data is only
+        stored once the forecast is submitted. They are also split after the
+        date the Inspector stops at. Blocks that do not fit the store (e.g.
+        unknown systems or dates) are logged and dropped.
+        """
+        for part in self._split(block):
+            try:
+                self.store.append(part.index, part.values, part.columns)
+            except (KeyError, ValueError, IndexError) as e:
+                log.error(f'Dropped block {block.seq} from {block.source}: {e}')
+                return
+            yield part
+
+    def _split(self, block):
+        """Split a block where forecasts may be due and after the last date."""
+        cuts = self.scheduler.cuts(block.index, self.store.cursor)
+        if self.until is not None:
+            last = np.searchsorted(block.index, self.until, side='right')
+            if 0 < last < len(block.index):
+                cuts = np.union1d(cuts, [last])
+        if not len(cuts):
+            return [block]
+        return [block._replace(index=index, values=values)
+                for index, values in zip(np.split(block.index, cuts),
+                                         np.split(block.values, cuts))]
+
+
+    def eval_actual(self, block):
+        """Evaluate the deviation between model- and actual data for a block.
+
+        All dates and systems of the block are evaluated at once. A log output
+        will be sent for every deviation that this method detects.
 
+        Args:
+            block (Block): Block of actual system data received from the reader.
 
+        Returns:
+            A tuple of two arrays with one row per date and one column per
+            system: a boolean mask of the deviations exceeding the threshold
+            and the deviations themselves.
+        """
 
-    def eval_actual(self, date, system):
-        """Evaluate the deviation between model- and actual data for a given date.
+        (model, actual) = self.block_values(block)
 
-        A log output will be sent for every deviation that this method detects.
+        # calculate the deviations
+        rs = methods.relative_deviations(model, actual, self.threshold)
+        (exceeds_threshold, deviations) = rs
+        for system, count in zip(block.columns, exceeds_threshold.sum(axis=0)):
+            self.deviations[system] += int(count)
 
-        Args:
-            date (TimeStamp): Date for which to evaluate.
-            system (str): Name of the actual system.
-        """
+        if log.isEnabledFor(logging.DEBUG):
+            for row, col in zip(*np.nonzero(exceeds_threshold)):
+                date = pd.Timestamp(block.index[row])
+                log.debug(f'Model-Actual deviation for '
+                        f'system: {block.columns[col]} '
+                        f'on {date.date()} '
+                        f'by {deviations[row, col]:.2%}.')
+
+        return rs
 
+    def block_values(self, block):
+        """Return the model and actual values of a block.
+
+        Both are arrays with one row per date and one column per system.
+        """
         # assertion will fail if the values are not available yet
-        assert system in self.df.columns
+        assert all(system in self.store for system in block.columns)
 
         # get the values
-        actual = self.df.loc[date, system]
-        model = self.df.loc[date, self.model_map[system]]
+        start = self.store.position(block.index[0])
+        stop = start + len(block.index)
+        models = self.store.get_indexer(
+            [self.model_map[system] for system in block.columns])
+        model = self.store.values[start:stop, models]
+        actual = block.values
 
         # sanity check
-        assert not pd.isnull(actual)
-        assert not pd.isnull(model)
+        assert not np.isnan(actual).any()
+        assert not np.isnan(model).any()
+        return (model, actual)
 
-        # calculate the deviation
-        rs = methods.relative_deviation(model, actual, self.threshold)
-        (exceeds_threshold, deviation) = rs
+    def detect(self, block):
+        """Watch the Model-Actual deviations of a block for drift.
 
-        if exceeds_threshold:
-            log.debug(f'Model-Actual deviation for '
-                    f'system: {system} '
-                    f'on {date.date()} '
-                    f'by {deviation:.2%}.')
+        The signed relative deviations of the actual from the model values
+        update the detector's state. A log output will be sent whenever an
+        alarm of a system starts.
+
+        Args:
+            block (Block): Block of actual system data received from the reader.
+
+        Returns:
+            A boolean mask of the alarms with one row per date and one column
+            per system.
+        """
+        (model, actual) = self.block_values(block)
+        model = np.where(model == 0, 0.00001, model)
+        columns = [self.args.systems.index(system) for system in block.columns]
+        (alarms, statistic) = self.detector.update((actual - model) / model,
+                                                   columns)
+
+        # an alarm starts on a row if the previous row raised none
+        previous = np.vstack([self._alarming[columns], alarms[:-1]])
+        for row, col in zip(*np.nonzero(alarms & ~previous)):
+            date = pd.Timestamp(block.index[row])
+            self.alarms[block.columns[col]] += 1
+            log.info(f'Drift alarm ({self.detector.name}) for '
+                     f'system: {block.columns[col]} '
+                     f'on {date.date()} '
+                     f'with statistic {statistic[row, col]:.2f}.')
+        self._alarming[columns] = alarms[-1]
+        return alarms
 
     def eval_future(self, period, system):
         """Evaluate the deviation between Model and Forecast data for a period.
 
-        Outputs the first date of any deviation in the logs and returns a
-        DatetimeIndex object with all the dates where deviations occurred.
-        Return None if no deviations were found.
+        Logs and returns the intervals of consecutive dates where the model
+        data falls outside of the forecast's confidence interval. Returns an
+        empty list if no deviations were found.
 
         The forecast with fbprophet returns a 95% confidence (yhat_lower, yhat_upper)
         interval along with the forecast (yhat). This information is used to identify
@@ -185,74 +445,78 @@ class Inspector:
 
         This function takes the following steps:
             1. Determine if forecast data is available for the required period
-            2. Access forecast and model columns from the dataframes
-            3. Create a mask column where the model data falls within the confidence interval
-            4. Output the dates / periods (if any) where this is the case
+            2. Access forecast and model columns by position as NumPy arrays
+            3. Create a mask where the model data falls outside the confidence interval
+            4. Compress the mask into intervals with their peak deviation
 
         Args:
             period (Period): Period for which to evaluate forecast vs model.
+
+        Returns:
+            A list of DeviationIntervals (see mosyco.methods) with the first
+            and last date and the peak relative deviation of each interval.
         """
 
         # ======================================================================
         # TODO:
-        # Output format? First date of deviation, period of consecutive deviations?
         # Probability of confidence interval is 95%. How to interpret this?
         # Make sure all available data is used for new forecasts
         # ======================================================================
 
-        # variable data has model and relevant forecasting data for period
+        # the latest forecast of the system for the period.
         # this will raise an exception if we haven't forecast the required period yet
         try:
-            data = pd.concat(
-                [
-                self.df.loc[period.start_time:period.end_time],
-                self.forecast.loc[period.start_time:period.end_time]
-                ],
-                axis=1)
+            forecast = self.forecasts.get(system, period)
         except KeyError as e:
             raise KeyError(f"Forecasting data for {period} not available.")
 
-        model_data = data.loc[:, self.model_map[system]]
-        yhat_lower = data.loc[:, 'yhat_lower']
-        yhat_upper = data.loc[:, 'yhat_upper']
+        # the model and the forecast share the store's index, so the period
+        # has the same positions in both
+        (start, stop) = (forecast.start, forecast.stop)
+        (yhat, yhat_lower, yhat_upper) = (
+            self.forecasts.column(forecast, column)
+            for column in ('yhat', 'yhat_lower', 'yhat_upper'))
 
-        forecast_data = data.loc[:, 'yhat']
-        deviations = (model_data - forecast_data) / forecast_data
+        model = self.model_map[system]
+        model_data = self.store.column(model, start, stop)
 
         # find out where model data falls outside forecast CI
-        outside = model_data.where(
-            (model_data < yhat_lower) | (model_data > yhat_upper))
-
+        (outside, deviations) = methods.interval_deviations(
+            model_data, yhat_lower, yhat_upper, yhat)
+        index = pd.DatetimeIndex(self.store.index[start:stop])
+        intervals = methods.deviation_intervals(index, outside, deviations)
 
-        outside_deviations = deviations.loc[outside.index]
-
-        if self.args.loglevel == logging.DEBUG:
-            for date, deviation in outside_deviations.iteritems():
+        if log.isEnabledFor(logging.DEBUG):
+            for interval in intervals:
                 log.debug(f'Model-Forecast deviation for '
-                        f'model: {self.model_map[system]} '
-                        f'on {date.date()} '
-                        f'by {deviation:.2%}.')
+                        f'model: {model} '
+                        f'from {interval.start.date()} '
+                        f'to {interval.end.date()} '
+                        f'by up to {interval.peak:.2%}.')
 
+            f_fit = 1.0 - outside.mean() if len(outside) else 1.0
+            log.debug(f'Finished evaluating {system} forecast: '
+                f'Model-Forecast fit: {f_fit:.2%}')
 
-        f_fit = 1.0 - (outside.count() / outside.size)
-        log.debug(f'Finished evaluating {system} forecast: '
-            f'Model-Forecast fit: {f_fit:.2%}')
+        # plot the forecast if in GUI-Mode or headless mode
+        if self.plot_channel is not None:
+            fc = pd.DataFrame({'yhat': yhat, 'yhat_upper': yhat_upper,
+                               'yhat_lower': yhat_lower}, index=index)
+            self.plot_channel.send_forecast(fc.resample('W').mean())
 
-        # plot the forecast if in GUI-Mode
-        if self.args.gui:
-            fc = data[['yhat', 'yhat_upper', 'yhat_lower']].resample('W').mean()
-            self.plotting_queue.put(fc)
+        return intervals
 
 
     def forecast_period(self, period, actual_system):
-        """Update forecast dataframe attribute with forecast for the given period.
+        """Schedule a forecast for the given period.
 
         A period can be any pandas period object or period-like string.
         For example, pd.Period('2011') & '2012-11' are valid periods.
 
-        The forecasting is done with
+        By default, the forecasting is done with
         `fbprophet <https://github.com/facebookincubator/prophet/tree/master/python>`_
-        on the bases already received actual data.
+        on the bases already received actual data. Faster backends can be
+        selected on the command line, see mosyco.forecasters.
 
         Prophet works best with at least one year of historical data, so the default
         is to wait until enough data is available and then periodcally update the
@@ -266,49 +530,66 @@ class Inspector:
 
         The fitting is computationally intensive and should therefore not be done
         too frequently or else the overall performance of the application will suffer.
+        It is therefore done in the background by the ForecastPool, while the
+        Inspector continues to evaluate new data. The forecast is merged into the
+        forecast dataframe by merge_forecasts once it is done.
 
         Procedure:
-            1. Create an empty dataframe for the required period
-            2. Call the prophet model's predict() function on this dataframe
-            3. Merge the prediction output into the forecast dataframe
-
+            1. Collect the history of the actual system and the dates of the period
+            2. Submit both to the ForecastPool, which fits a new model of the
+               selected backend
+            3. The model's predict() function is called for the period's dates
+
+        Returns:
+            False if the forecast was not submitted, because the period lies
+            beyond the data or the ForecastPool's queue was full.
         """
-        # EXPENSIVE - CAN TAKE VERY LONG
-        fc_model = self._fit_model(actual_system)
-
-        # double check / assert here that period is in df
-        assert 'ds' in self.df.columns
-        fc_frame = self.df.loc[period.start_time:period.end_time, ['ds']]
+        history = self._history(actual_system)
 
-        # EXPENSIVE - CAN TAKE VERY LONG
-        new_forecast = fc_model.predict(fc_frame)
+        # the period may lie beyond the end of the data
+        (start, stop) = self.store.locate(period.start_time, period.end_time)
+        if stop <= start:
+            log.debug(f'Skipped {actual_system} forecast for {period}, which '
+                      'lies beyond the data.')
+            return False
 
-        # new_forecast needs to have DateTimeIndex
-        new_forecast.set_index('ds', inplace=True)
+        log.debug(f'{actual_system} forecast is {self.staleness(actual_system)} '
+                  'rows stale.')
 
-        # merge it into forecast dataframe
-        self.forecast = self.forecast.combine_first(new_forecast)
+        # warm start from the previous fit if requested
+        init = None
+        if self.args.warm_start:
+            init = self.fit_params.get(actual_system)
 
-    def _fit_model(self, system):
-        """Fit and return a new forecasting model.
-
-        This is also an expensive operation. It creates a new Prophet object each
-        time this function is called. The fitting can take up to 5 seconds on
-        occasion but should generally be quite fast, thanks to
-        `PyStan <https://pystan.readthedocs.io/en/latest/>`_.
-
-        This is the bottleneck that restricts the real-time capability of this
-        prototype. This implementation is not suitable for use cases
-        that require new forecasts every few seconds or so. However, it does work
-        very well for frequencies of once per minute or less.
+        # EXPENSIVE - CAN TAKE VERY LONG
+        return self.pool.submit(actual_system, period, history,
+                                self.store.index[start:stop], self.store.cursor,
+                                init)
+
+    def _history(self, system):
+        """Return the training data for a forecast of the given system.
+
+        The history only covers the observed rows up to the store's write
+        cursor, so no time is wasted on the future dates that are still NaN.
+        With a fit window, it only covers the most recent of them.
+
+        The history is a copy rather than a view on the store. Late blocks
+        from multiple sources can still change observed rows, and the
+        forecast (as well as its cache key) has to be based on the data at
+        the time it was submitted, not whenever the forecasting stage gets
+        to it.
         """
-        # We need to set 'y' column again each time because the actual value
+        # We need to build the history each time because the actual value
         # column receives new values in the meantime.
-        try:
-            self.df['y'] = self.df[system]
-        except AttributeError as e:
-            raise AttributeError("inspector does not have actual {system} data \
-                                    for forecast yet.")
-
-        # No custom settings for model --> forecast is just for illustration
-        return Prophet().fit(self.df[['ds', 'y']])
+        if system not in self.store:
+            raise AttributeError(f"inspector does not have actual {system} data "
+                                 "for forecast yet.")
+
+        # only use a window of the most recent history if requested
+        start = 0
+        if self.args.fit_window:
+            start = max(0, self.store.cursor - self.args.fit_window)
+
+        (index, values) = self.store.observed(system, start)
+        return pd.DataFrame({'ds': index.copy(), 'y': values.copy()},
+                            copy=False)
@@ -7,7 +7,44 @@ These deviations are later used in analysis to determine if the simulation
 should be adjusted.
 
 This module may be extended.
+
+The functions ending in ``deviations`` are vectorized versions of the scalar
+checks. They accept arrays of any (matching) shape, e.g. one row per date and
+one column per system, and return a boolean mask of the values that exceed the
+threshold along with the deviations themselves.
+
+Masks over consecutive dates can be compressed into deviation intervals with
+deviation_intervals, so that a long period with few deviations is reported as
+a handful of records rather than one per date.
+
+A fixed threshold only catches large deviations, and a sustained drift away
+from the model is only noticed once it has grown beyond it. The streaming
+detectors at the end of this module watch the deviations of each system for
+changes instead:
+
+    zscore
+        RollingZScore compares each value with the mean and standard
+        deviation of the previous values in a rolling window. It reacts to
+        sudden shifts.
+    ewma
+        EWMAChart is an exponentially weighted moving average control chart.
+        It reacts to small but sustained shifts and trends.
+    cusum
+        CUSUM accumulates the deviations from the in-control mean. It reacts
+        to small but sustained shifts and trends, usually faster than ewma.
+
+Each detector holds a handful of numbers per system and updates them in O(1)
+per row, no matter how much data has been observed. The values are passed in
+batches with one row per date and one column per system.
 """
+from collections import namedtuple
+
+import numpy as np
+
+# a run of consecutive deviations, from its first to its last (inclusive) date,
+# along with the deviation that is farthest from zero
+DeviationInterval = namedtuple('DeviationInterval', ['start', 'end', 'peak'])
+
 
 def absolute_deviation(simulated, observed, threshold):
     """Return the absolute deviation of a simulated value from an observed value."""
@@ -25,3 +62,412 @@ def relative_deviation(simulated, observed, threshold):
         return (True, dev)
     else:
         return (False, dev)
+
+
+
+def absolute_deviations(simulated, observed, threshold):
+    """Return the exceedance mask and absolute deviations for arrays of values."""
+    simulated = np.asarray(simulated, dtype=np.float64)
+    observed = np.asarray(observed, dtype=np.float64)
+
+    dev = np.abs(simulated - observed)
+    return (dev > threshold, dev)
+
+def relative_deviations(simulated, observed, threshold):
+    """Return the exceedance mask and relative deviations for arrays of values."""
+    simulated = np.asarray(simulated, dtype=np.float64)
+    observed = np.asarray(observed, dtype=np.float64)
+
+    # avoid division by zero in the same way as relative_deviation
+    observed = np.where(observed == 0, 0.00001, observed)
+
+    dev = np.abs(simulated - observed) / observed
+    return (dev > threshold, dev)
+
+def interval_deviations(simulated, lower, upper, reference):
+    """Return the mask of values outside an interval and their relative deviations.
+
+    The deviations are signed and relative to the reference, e.g. the
+    forecast at the center of its confidence interval. Comparisons with NaN
+    bounds never count as outside.
+    """
+    simulated = np.asarray(simulated, dtype=np.float64)
+    lower = np.asarray(lower, dtype=np.float64)
+    upper = np.asarray(upper, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dev = (simulated - reference) / reference
+    return ((simulated < lower) | (simulated > upper), dev)
+
+def runs(mask):
+    """Return the start and stop positions of the runs of True in a 1-d mask.
+
+    The stop positions are exclusive, like those of a slice.
+    """
+    mask = np.asarray(mask, dtype=np.int8)
+    edges = np.flatnonzero(np.diff(np.r_[np.int8(0), mask, np.int8(0)]))
+    return (edges[::2], edges[1::2])
+
+def deviation_intervals(index, mask, deviations):
+    """Compress a mask of deviations into a list of DeviationIntervals.
+
+    Args:
+        index (array): dates (or any labels) of the positions.
+        mask (array): 1-d boolean mask of the deviations, e.g. as returned by
+            one of the functions ending in ``deviations``.
+        deviations (array): deviations at the same positions.
+
+    Returns:
+        A list with one DeviationInterval per run of consecutive deviations.
+    """
+    (starts, stops) = runs(mask)
+    if not len(starts):
+        return []
+
+    # the peak of each run is its maximum or minimum, whichever is farther
+    # from zero; the positions between two runs are masked out
+    mask = np.asarray(mask, dtype=bool)
+    deviations = np.asarray(deviations, dtype=np.float64)
+    highest = np.maximum.reduceat(np.where(mask, deviations, -np.inf), starts)
+    lowest = np.minimum.reduceat(np.where(mask, deviations, np.inf), starts)
+    peaks = np.where(np.abs(lowest) > np.abs(highest), lowest, highest)
+
+    return [DeviationInterval(index[start], index[stop - 1], peak)
+            for (start, stop, peak) in zip(starts, stops, peaks)]
+
+
+class RunningStats:
+    """The mean and variance of all values so far, per column.
+
+    The statistics are updated with Welford's algorithm, generalized to
+    batches by Chan et al., which is numerically stable even for long streams.
+
+    Attributes:
+        count (ndarray): number of values of each column.
+        mean (ndarray): mean of each column.
+        m2 (ndarray): sum of the squared differences from the mean of each
+            column.
+    """
+    def __init__(self, width):
+        self.count = np.zeros(width, dtype=np.int64)
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+
+    @property
+    def var(self):
+        """Sample variance of each column, NaN for less than two values."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+    @property
+    def std(self):
+        """Sample standard deviation of each column."""
+        return np.sqrt(self.var)
+
+    def update(self, values, columns=slice(None), mask=None):
+        """Add a batch of values.
+
+        Args:
+            values (ndarray): one row per date and one column per column in
+                columns.
+            columns: positions of the columns of values, all by default.
+            mask (ndarray): boolean mask of the values to add, all by default.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if mask is None:
+            mask = np.ones(values.shape, dtype=bool)
+
+        # statistics of the batch
+        n = mask.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(mask, values, 0).sum(axis=0) / n
+        m2 = (np.where(mask, values - mean, 0) ** 2).sum(axis=0)
+
+        # combined with the statistics of the previous values
+        count = self.count[columns]
+        total = count + n
+        added = n > 0
+        delta = np.where(added, mean - self.mean[columns], 0)
+        share = np.divide(n, total, out=np.zeros(len(n)), where=added)
+        self.mean[columns] += delta * share
+        self.m2[columns] += np.where(added, m2, 0) + delta**2 * count * share
+        self.count[columns] = total
+
+
+class RollingStats:
+    """The mean and variance of the last window values, per column.
+
+    Welford's algorithm is applied to a sliding window: each new value
+    replaces the oldest one in a ring buffer, and the statistics are updated
+    with both.
+
+    Attributes:
+        window (int): number of values the statistics are computed over.
+        count (ndarray): number of values of each column so far.
+        mean (ndarray): mean of the window of each column.
+        m2 (ndarray): sum of the squared differences from the mean of the
+            window of each column.
+    """
+    def __init__(self, width, window):
+        self.window = window
+        self.count = np.zeros(width, dtype=np.int64)
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+        self._buffer = np.zeros((window, width))
+
+    @property
+    def var(self):
+        """Sample variance of each column, NaN for less than two values."""
+        n = np.minimum(self.count, self.window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # the updates can leave tiny negative rounding errors behind
+            return np.where(n > 1, np.maximum(self.m2, 0) / (n - 1), np.nan)
+
+    @property
+    def std(self):
+        """Sample standard deviation of each column."""
+        return np.sqrt(self.var)
+
+    def push(self, row, columns=None):
+        """Add one value to each of the columns.
+
+        Args:
+            row (ndarray): one value per column in columns.
+            columns: positions of the columns of row, all by default.
+        """
+        if columns is None:
+            columns = np.arange(len(self.count))
+        row = np.asarray(row, dtype=np.float64)
+        count = self.count[columns]
+        slot = count % self.window
+        old = self._buffer[slot, columns]
+        full = count >= self.window
+
+        # add the new value, then remove the old one from full windows
+        mean = self.mean[columns]
+        n = np.minimum(count + 1, self.window)
+        delta = np.where(full, row - old, row - mean)
+        updated = mean + delta / n
+        self.m2[columns] += np.where(full,
+                                     delta * (row - updated + old - mean),
+                                     delta * (row - updated))
+        self.mean[columns] = updated
+        self._buffer[slot, columns] = row
+        self.count[columns] = count + 1
+
+
+class Detector:
+    """Base class of the streaming detectors.
+
+    A detector watches one signal per system, e.g. the signed relative
+    deviation of the actual from the model values. Systems may be passed in
+    any subset and order, so each batch names the positions of its columns.
+
+    Attributes:
+        width (int): number of systems.
+    """
+    name = None
+    # standard deviations below this are treated as this, e.g. those of a
+    # system that has matched its model exactly so far
+    min_std = 0.001
+
+    def __init__(self, width):
+        self.width = width
+
+    def _columns(self, columns):
+        if columns is None:
+            return np.arange(self.width)
+        return np.asarray(columns, dtype=np.intp)
+
+    def update(self, values, columns=None):
+        """Update the state with a batch of values and check it.
+
+        Args:
+            values (ndarray): one row per date and one column per system.
+            columns: positions of the systems of values, all by default.
+
+        Returns:
+            A tuple of two arrays shaped like values: a boolean mask of the
+            alarms and the statistic of the detector, NaN while the detector
+            is warming up.
+        """
+        raise NotImplementedError
+
+
+class RollingZScore(Detector):
+    """Raises an alarm when a value is far from the previous values.
+
+    Each value is standardized with the mean and standard deviation of the
+    window values before it. The detector warms up until the window is full.
+
+    Attributes:
+        window (int): number of previous values to compare with.
+        threshold (float): z-score beyond which an alarm is raised.
+        stats (RollingStats): statistics of the window of each system.
+    """
+    name = 'zscore'
+
+    def __init__(self, width, window=30, threshold=4.0):
+        super().__init__(width)
+        self.window = window
+        self.threshold = threshold
+        self.stats = RollingStats(width, window)
+
+    def update(self, values, columns=None):
+        columns = self._columns(columns)
+        values = np.asarray(values, dtype=np.float64)
+        scores = np.full(values.shape, np.nan)
+
+        for (i, row) in enumerate(values):
+            ready = self.stats.count[columns] >= self.window
+            std = np.maximum(self.stats.std[columns], self.min_std)
+            scores[i] = np.where(ready,
+                                 (row - self.stats.mean[columns]) / std, np.nan)
+            self.stats.push(row, columns)
+
+        with np.errstate(invalid='ignore'):
+            return (np.abs(scores) > self.threshold, scores)
+
+
+class ControlChart(Detector):
+    """Base class of the detectors that compare against an in-control state.
+
+    The first warmup values of each system are assumed to be in control.
+    Their mean and standard deviation are used to standardize the following
+    values, which are then monitored.
+
+    Attributes:
+        warmup (int): number of values the in-control state is estimated on.
+        reference (RunningStats): statistics of the warmup values.
+    """
+    def __init__(self, width, warmup=90):
+        super().__init__(width)
+        self.warmup = warmup
+        self.reference = RunningStats(width)
+
+    def standardize(self, values, columns):
+        """Return the standardized values and a mask of the monitored ones.
+
+        The values that are still part of the warmup update the reference and
+        are not monitored.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        left = np.maximum(self.warmup - self.reference.count[columns], 0)
+        warming = np.arange(len(values))[:, np.newaxis] < left
+        if warming.any():
+            self.reference.update(values, columns, warming)
+
+        std = np.maximum(np.nan_to_num(self.reference.std[columns]), self.min_std)
+        return ((values - self.reference.mean[columns]) / std, ~warming)
+
+
+class EWMAChart(ControlChart):
+    """An exponentially weighted moving average (EWMA) control chart.
+
+    The chart averages the standardized values with weight smoothing and
+    raises an alarm when the average leaves the control limits, which are
+    limit standard deviations of the average wide.
+
+    Attributes:
+        smoothing (float): weight of the newest value.
+        limit (float): width of the control limits.
+        average (ndarray): moving average of each system.
+        count (ndarray): number of monitored values of each system.
+    """
+    name = 'ewma'
+
+    def __init__(self, width, warmup=90, smoothing=0.2, limit=3.0):
+        super().__init__(width, warmup)
+        self.smoothing = smoothing
+        self.limit = limit
+        self.average = np.zeros(width)
+        self.count = np.zeros(width, dtype=np.int64)
+
+    def update(self, values, columns=None):
+        columns = self._columns(columns)
+        (values, monitored) = self.standardize(values, columns)
+        averages = np.full(values.shape, np.nan)
+        limits = np.full(values.shape, np.nan)
+
+        lam = self.smoothing
+        average = self.average[columns]
+        count = self.count[columns]
+        for (i, (row, active)) in enumerate(zip(values, monitored)):
+            average = np.where(active, average + lam * (row - average), average)
+            count = count + active
+            # the variance of the average grows towards lam / (2 - lam)
+            var = lam / (2 - lam) * (1 - (1 - lam) ** (2 * count))
+            averages[i] = np.where(active, average, np.nan)
+            limits[i] = self.limit * np.sqrt(var)
+        self.average[columns] = average
+        self.count[columns] = count
+
+        with np.errstate(invalid='ignore'):
+            return (np.abs(averages) > limits, averages)
+
+
+class CUSUM(ControlChart):
+    """A two-sided cumulative sum (CUSUM) control chart.
+
+    The chart sums up the standardized values beyond the allowance, one sum
+    for increases and one for decreases, and raises an alarm while one of the
+    sums is above the decision interval. The sums are not reset after an
+    alarm, so a sustained drift raises a single long alarm.
+
+    Attributes:
+        allowance (float): standardized deviation that is tolerated.
+        interval (float): decision interval of the sums.
+        high (ndarray): sum of the increases of each system.
+        low (ndarray): sum of the decreases of each system.
+    """
+    name = 'cusum'
+
+    def __init__(self, width, warmup=90, allowance=0.5, interval=5.0):
+        super().__init__(width, warmup)
+        self.allowance = allowance
+        self.interval = interval
+        self.high = np.zeros(width)
+        self.low = np.zeros(width)
+
+    def _accumulate(self, start, steps):
+        # S = max(0, S + step) for all rows at once: it is the cumulative
+        # sum minus its lowest value so far (or zero)
+        sums = start + np.cumsum(steps, axis=0)
+        return sums - np.minimum(np.minimum.accumulate(sums, axis=0), 0)
+
+    def update(self, values, columns=None):
+        columns = self._columns(columns)
+        (values, monitored) = self.standardize(values, columns)
+        if not len(values):
+            return (monitored, values)
+
+        # the values that are not monitored leave the sums unchanged
+        high = self._accumulate(self.high[columns],
+                                np.where(monitored, values - self.allowance, 0))
+        low = self._accumulate(self.low[columns],
+                               np.where(monitored, -values - self.allowance, 0))
+        self.high[columns] = high[-1]
+        self.low[columns] = low[-1]
+
+        sums = np.where(monitored, np.where(high >= low, high, -low), np.nan)
+        with np.errstate(invalid='ignore'):
+            return (np.abs(sums) > self.interval, sums)
+
+
+# the detectors by name
+detectors = {detector.name: detector
+             for detector in (RollingZScore, EWMAChart, CUSUM)}
+
+
+def create_detector(name, width, **kwargs):
+    """Return a new detector of the given name for width systems.
+
+    Raises:
+        ValueError: if there is no detector of that name.
+    """
+    try:
+        detector = detectors[name]
+    except KeyError:
+        raise ValueError(f"Unknown detector: {name}")
+    return detector(width, **kwargs)
@@ -2,6 +2,7 @@
 """This module is responsible for parsing the command line arguments."""
 
 import argparse
+import datetime
 import logging
 import sys
 
@@ -12,6 +13,41 @@ model_list = ['PAmodel']
 system_list = ['PAseasonal']
 # DEFAULT THRESHOLD
 default_threshold = 0.03
+# DEFAULT TRANSPORT SETTINGS
+default_batch_size = 1
+default_flush_interval = 0.1
+default_delay = 0.001
+# DEFAULT QUEUE SETTINGS
+default_queue_size = 64
+default_plot_queue_size = 1000
+default_queue_policy = 'block'
+queue_policy_list = ['block', 'drop-oldest', 'coalesce']
+# DEFAULT MERGE BUFFER FOR MULTIPLE SOURCES
+default_merge_buffer = 64
+# DEFAULT FORECAST SETTINGS
+default_forecast_queue_size = 8
+default_forecaster = 'prophet'
+default_forecast_cache_size = 256
+# SHORTEST FIT WINDOW, THE MINIMUM HISTORY OF mosyco.scheduler.Scheduler
+min_fit_window = 365
+# DEFAULT FORECAST SCHEDULE
+default_cadence = 'period'
+cadence_list = ['period', 'rows', 'drift']
+default_horizon = 'year'
+horizon_list = ['year', 'quarter', 'month', 'week']
+default_cadence_rows = 90
+default_drift_rate = 0.5
+default_drift_window = 30
+# STREAMING DRIFT DETECTORS
+detector_list = ['zscore', 'ewma', 'cusum']
+# DEFAULT DATE AFTER WHICH THE INSPECTOR STOPS
+default_until = '2005-12-31'
+forecaster_list = ['prophet', 'naive', 'holt-winters', 'regression']
+# DEFAULT RUNTIME
+default_runtime = 'threads'
+runtime_list = ['threads', 'asyncio']
+# DEFAULT SECONDS BETWEEN TWO RENDERED FRAMES
+default_render_interval = 1.0
 
 desc = ("Prototype for a Model-/System-Controller architecture. "
         "\n\n"
@@ -44,6 +80,63 @@ def valid_threshold(f):
     else:
         return f
 
+def positive_int(i):
+    """Determine if i is an integer greater than 0."""
+    i = int(i)
+    if i < 1:
+        msg = f"Invalid value: {i} is not a positive integer"
+        raise argparse.ArgumentTypeError(msg)
+    else:
+        return i
+
+def valid_fit_window(i):
+    """Determine if i is an integer of at least min_fit_window."""
+    i = int(i)
+    if i < min_fit_window:
+        msg = (f"Invalid fit window: {i} is less than the {min_fit_window} "
+               "rows of history a forecast needs")
+        raise argparse.ArgumentTypeError(msg)
+    else:
+        return i
+
+def non_negative_int(i):
+    """Determine if i is an integer greater than or equal to 0."""
+    i = int(i)
+    if i < 0:
+        msg = f"Invalid value: {i} is negative"
+        raise argparse.ArgumentTypeError(msg)
+    else:
+        return i
+
+def non_negative_float(f):
+    """Determine if f is a float greater than or equal to 0."""
+    f = float(f)
+    if f < 0.0:
+        msg = f"Invalid value: {f} is negative"
+        raise argparse.ArgumentTypeError(msg)
+    else:
+        return f
+
+def positive_float(f):
+    """Determine if f is a float greater than 0."""
+    f = float(f)
+    if f <= 0.0:
+        msg = f"Invalid value: {f} is not a positive number"
+        raise argparse.ArgumentTypeError(msg)
+    else:
+        return f
+
+def valid_date(s):
+    """Determine if s is a date in YYYY-MM-DD format, or 'end'."""
+    if s == 'end':
+        return None
+    try:
+        datetime.datetime.strptime(s, '%Y-%m-%d')
+    except ValueError:
+        msg = f"Invalid date: {s} is not in YYYY-MM-DD format"
+        raise argparse.ArgumentTypeError(msg)
+    return s
+
 def parse_arguments():
     """Parse the command line arguments."""
     parser = argparse.ArgumentParser(prog="mosyco",
@@ -66,7 +159,8 @@ def parse_arguments():
             nargs='+', default=system_list)
 
     parser.add_argument("-m", "--models",
-            help="A list of the model data columns. e.g. --models 'PAmodel1' 'PAmodel2'",
+            help="A list of the model data columns, one per system or a single "
+            "one for all systems. e.g. --models 'PAmodel1' 'PAmodel2'",
             nargs='+', default=model_list)
 
     # Threshold value
@@ -75,12 +169,188 @@ def parse_arguments():
             default=default_threshold,
             type=valid_threshold)
 
+    # Drift detection
+    parser.add_argument("--detector",
+            help="Watch the Model-Actual deviations of each system for drift "
+            "with a streaming detector: zscore (rolling z-score), ewma (EWMA "
+            "control chart) or cusum (CUSUM control chart)",
+            default=None,
+            choices=detector_list)
+
+    # Transport between reader and inspector
+    parser.add_argument("--batch-size",
+            help="The maximum number of rows the reader sends to the inspector at once",
+            default=default_batch_size,
+            type=positive_int)
+
+    parser.add_argument("--flush-interval",
+            help="Seconds after which the reader sends an incomplete batch",
+            default=default_flush_interval,
+            type=non_negative_float)
+
+    parser.add_argument("--chunk-size",
+            help="Stream the system data from the source file in chunks of this "
+            "many rows instead of loading it at once",
+            default=None,
+            type=positive_int)
+
+    parser.add_argument("--delay",
+            help="Simulated seconds between two system rows. Use 0 to replay "
+            "the data as fast as possible",
+            default=default_delay,
+            type=non_negative_float)
+
+    # Queues between the components
+    parser.add_argument("--queue-size",
+            help="The maximum number of blocks waiting for the inspector",
+            default=default_queue_size,
+            type=positive_int)
+
+    parser.add_argument("--queue-policy",
+            help="What to do with a new block while the inspector's queue is "
+            "full: block the reader (default), drop the oldest block or "
+            "coalesce to the latest block",
+            default=default_queue_policy,
+            choices=queue_policy_list)
+
+    parser.add_argument("--plot-queue-size",
+            help="The maximum number of items waiting for the plotter in GUI-mode",
+            default=default_plot_queue_size,
+            type=positive_int)
+
+    parser.add_argument("--plot-queue-policy",
+            help="What to do with a new item while the plotter's queue is full",
+            default=default_queue_policy,
+            choices=queue_policy_list)
+
+    # Live sources
+    parser.add_argument("--sources",
+            help="Observe these live sources instead of the sample data. A source "
+            "is given as 'kind:target:columns', where kind is one of file, pipe, "
+            "tcp or unix. e.g. --sources 'pipe:/tmp/plant1:PAseasonal' "
+            "'tcp:localhost:9000:PAtrend'",
+            nargs='+', default=None)
+
+    parser.add_argument("--merge-buffer",
+            help="The maximum number of blocks buffered to merge the sources "
+            "in date order",
+            default=default_merge_buffer,
+            type=positive_int)
+
+    parser.add_argument("--runtime",
+            help="Run the sources and the inspector as threads (default) or as "
+            "coroutines of a single asyncio event loop",
+            default=default_runtime,
+            choices=runtime_list)
+
+    parser.add_argument("--shards",
+            help="Partition the systems (or sources) across this many "
+            "processes, each with its own reader and inspector",
+            default=1,
+            type=positive_int)
+
+    # Forecasting
+    parser.add_argument("-f", "--forecaster",
+            help="The forecasting backend: prophet (default), naive (seasonal "
+            "naive), holt-winters (exponential smoothing) or regression "
+            "(rolling linear regression)",
+            default=default_forecaster,
+            choices=forecaster_list)
+
+    parser.add_argument("--workers",
+            help="The number of worker processes used for forecasting. Use 0 "
+            "to forecast inside the inspector. Defaults to the number of CPUs",
+            default=None,
+            type=non_negative_int)
+
+    parser.add_argument("--forecast-queue-size",
+            help="The maximum number of forecasts waiting for a worker. Further "
+            "forecasts are skipped until the queue has room again",
+            default=default_forecast_queue_size,
+            type=positive_int)
+
+    parser.add_argument("--warm-start",
+            help="Start each forecast's fit from the parameters of the "
+            "previous fit",
+            action="store_true")
+
+    parser.add_argument("--forecast-cache",
+            help="Cache the forecasts on disk and load identical forecasts "
+            "from the cache instead of fitting them again",
+            action="store_true")
+
+    parser.add_argument("--forecast-cache-size",
+            help="The maximum size of the forecast cache in megabytes. The "
+            "least recently used forecasts are removed beyond it",
+            default=default_forecast_cache_size,
+            type=positive_int)
+
+    parser.add_argument("--cadence",
+            help="When to forecast: at the end of each period (default), every "
+            "CADENCE_ROWS rows or whenever a system's deviation rate rises "
+            "above DRIFT_RATE (drift)",
+            default=default_cadence,
+            choices=cadence_list)
+
+    parser.add_argument("--horizon",
+            help="The length of the forecast periods. Each forecast covers "
+            "the period after the current one",
+            default=default_horizon,
+            choices=horizon_list)
+
+    parser.add_argument("--cadence-rows",
+            help="The number of rows between two forecasts of the rows cadence",
+            default=default_cadence_rows,
+            type=positive_int)
+
+    parser.add_argument("--drift-rate",
+            help="The share of Model-Actual deviations that triggers a "
+            "forecast of the drift cadence",
+            default=default_drift_rate,
+            type=valid_threshold)
+
+    parser.add_argument("--drift-window",
+            help="The number of rows the deviation rate of the drift cadence "
+            "is averaged over",
+            default=default_drift_window,
+            type=positive_int)
+
+    parser.add_argument("--forecast-budget",
+            help="The seconds of fitting all forecasts may take per second on "
+            "average. Further forecasts are skipped. Unlimited by default",
+            default=None,
+            type=positive_float)
+
+    parser.add_argument("--fit-window",
+            help="Only fit forecasts on this number of the most recent rows, "
+            f"at least {min_fit_window}",
+            default=None,
+            type=valid_fit_window)
+
+    parser.add_argument("--until",
+            help="Stop the inspection after this date (YYYY-MM-DD). Use 'end' "
+            "to inspect all data",
+            default=default_until,
+            type=valid_date)
+
     # Animation
     parser.add_argument("--gui",
             help="GUI-mode: show live updating plots. This will only work " +
             "if for single model and system values.",
             action="store_true")
 
+    # Headless rendering
+    parser.add_argument("--render",
+            help="Headless mode: render the live updating plots without a "
+            "display, as PNG snapshots into the directory RENDER or as an "
+            "animation if RENDER ends with .gif or a video extension like .mp4",
+            default=None)
+
+    parser.add_argument("--render-interval",
+            help="Seconds between two rendered frames in headless mode",
+            default=default_render_interval,
+            type=positive_float)
+
     # Log to file
     parser.add_argument("--logfile",
             help="Log to a file called 'mosyco.log'",
@@ -88,12 +358,25 @@ def parse_arguments():
 
     args = parser.parse_args()
 
-    if args.gui and (len(args.systems) > 1):
+    if args.gui and args.render:
+        print(" GUI-mode and headless mode can not be combined.")
+        sys.exit()
+
+    if (args.gui or args.render) and (len(args.systems) > 1):
         print(" GUI-mode is only available for a single system and model.")
         sys.exit()
 
+    if (args.gui or args.render) and args.shards > 1:
+        print(" GUI-mode is not available for multiple shards.")
+        sys.exit()
+
     if not len(args.systems) == len(args.models) and len(args.models) > 1:
         print(" Matching number of systems/models required for multi-model calls.")
+        sys.exit()
+
+    # a single model is the model of every system
+    if len(args.models) == 1:
+        args.models = args.models * len(args.systems)
 
 
     if args.quiet:
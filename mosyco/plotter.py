@@ -2,225 +2,82 @@
 import matplotlib
 matplotlib.use('Qt5Agg')
 from matplotlib.backends.backend_qt5agg import FigureCanvas
-import matplotlib.animation as animation
-from matplotlib.figure import Figure
-from matplotlib.gridspec import GridSpec
 
 from PyQt5 import QtCore, QtWidgets
 
 import logging
-import pandas as pd
-from dateutil.relativedelta import relativedelta
-
-from queue import Empty, Queue
+import time
 import multiprocessing as mp
 
-from functools import partial
-from collections import defaultdict, deque
-
-from mosyco.reader import Reader
-from mosyco.inspector import Inspector
-import mosyco.helpers as helpers
+from mosyco.dashboard import Dashboard, run_mosyco
 
 log = logging.getLogger(__name__)
 
-def run_mosyco(args, plotting_queue):
-    """Start the Mosyco Prototype"""
-    reader_queue = Queue()
-    reader = Reader(args.systems, reader_queue)
-    inspector = Inspector(reader.df.index.copy(),
-                                reader.df[args.models],
-                                args,
-                                reader_queue,
-                                plotting_queue)
-    reader.start()
-    inspector.start()
-
 class Plotter(QtWidgets.QApplication):
     """The Plotter is responsible for animating the Mosyco data.
 
+    The data is drawn by a Dashboard, which the Plotter shows in a Qt window.
+
     Attributes:
         args: Command Line Arguments
-        system_name: Name of the actual system
-        model_name: Model name
-        inspector: Reference to the Inspector object
-        reader: Reference to the Reader object (usually a Thread objectß)
-        plotting_queue: Queue used for communicating with Inspector
-        model_data: DataFrame containing the model data
-        data: Dictionary to be filled and plotted
-        half_period_length: Period / 2
-        paused: Whether or not the plot is currently paused
-        update_legend: If legend needs to be updated
-        artists: list of animated artist items to be redrawn each frame
-        fig: Figure object
-        ax1: Top Axes object (System View)
-        ax2: Bottom Axes object (Forecast View)
-        fc_lines: Deque of forecast lines
-        leg_dict: Legend dictionary
-        legend: Legend object
-        ani: FuncAnimation responsible for the animation
-        rs_model: Resampled version of model data
+        plot_channel: PlotChannel used for communicating with Inspector
+        dashboard: Dashboard that draws the plots
+        process: Process running the reader and the inspector
+        frame_cost: Moving average of the seconds it takes to draw a frame
+        frame_budget: Share of the time to spend on drawing
+        min_interval: Minimum milliseconds between two frames
+        max_interval: Maximum milliseconds between two frames
+        blitter: Blitter that redraws the animated artists each frame
+        timer: QTimer responsible for the animation
         canvas: FigureCanvas used for QT Backend
         main_widget: QT Application Widget
 
     """
-    def __init__(self, args, plotting_queue):
+    # share of the time to spend on drawing, and the limits of the interval
+    # between two frames in milliseconds
+    frame_budget = 0.5
+    min_interval = 40
+    max_interval = 1000
+
+    def __init__(self, args, plot_channel):
         super().__init__([__package__])
         self.args = args
-        # there is only one model & system in GUI mode
-        self.system_name = args.systems[0]
-        self.model_name = args.models[0]
-        self.plotting_queue = plotting_queue
-
-        # dic attempt
-        # defaultdict w/ column names as keys and a deque of equal length
-        # for each column...
-        # model series
-        temp_df = helpers.load_dataframe()
-        self.model_data = temp_df[args.models].copy()
-
-        self.data = defaultdict(partial(deque, maxlen=400))
+        self.plot_channel = plot_channel
+        self.dashboard = Dashboard(args, plot_channel)
 
+        # prepare the canvas
+        self.prepare_canvas()
 
-        # TODO: get this from somewhere or leave as default
-        # this needs to be half the period b/c we need to divide it later
-        # and relativedeltas can not always be divided but always multiplied
-        self.half_period_length = relativedelta(months=6)
-        self.deviation_count = 0
-        self.artists = []
-        self.paused = False
-        self.update_legend = False
-        self.prepare_plot()
+        # setup animation: only the animated artists are redrawn on each
+        # frame, unless anything else has changed
+        self.blitter = Blitter(self.canvas, self.dashboard.artists)
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.step)
+        self.lastWindowClosed.connect(self.timer.stop)
+        self.frame_cost = None
+        self.timer.start(self.min_interval)
 
 
     def run(self):
         """Run the Plotter"""
-        self.process = mp.Process(target=run_mosyco, args=(self.args, self.plotting_queue), daemon=True)
+        # the process is not a daemon, because the inspector starts its own
+        # forecasting processes; it is terminated once the gui is closed
+        self.process = mp.Process(target=run_mosyco, args=(self.args, self.plot_channel))
         self.process.start()
 
         # start gui
         self.main_widget.show()
         self.exec_()
+        self.process.terminate()
 
+        if self.plot_channel.rows.lost:
+            log.info(f'The plotter skipped {self.plot_channel.rows.lost} rows '
+                     'it could not keep up with.')
 
-    def prepare_plot(self):
-        """Prepare drawable objects for the animation."""
-
-        matplotlib.style.use('seaborn')
-
-        # create figure and axes objects
-        self.fig = Figure(tight_layout=True)
-        gs = GridSpec(3, 1, height_ratios=[1, 4, 4])
-        self.ax1 = self.fig.add_subplot(gs[1])
-        self.ax2 = self.fig.add_subplot(gs[2], sharex=self.ax1)
-
-
-        self.ax1.set_title('System View')
-        self.ax2.set_title('Forecast View')
-
-        self.ax1.set_ylabel('Units')
-        self.ax2.set_ylabel('Units')
-
-        # actual system lines
-        (self.acl1, ) = self.ax1.plot([], [], c='blue', ls='solid', lw=0.7)
-        (self.acl2, ) = self.ax2.plot([], [], c='blue', ls='solid', lw=0.7)
-
-        # object to
-        self.fc_lines = deque(maxlen=4)
-
-        # plot model w/ standard confidence interval
-        self.plot_model()
-
-        # add lines to artist list
-        self.artists.extend([self.acl1, self.acl2])
-
-        # TODO: set lim automatically
-        self.ax1.set_ylim(800, 1300)
-        self.ax2.set_ylim(800, 1300)
-
-        self.ax1.set_autoscaley_on(True)
-        self.ax2.set_autoscaley_on(True)
-
-        # prepare initial limits for the x-axes
-        start_date = self.model_data.index[0]
-        self.ax1.set_xlim(start_date, start_date
-                          + self.half_period_length * 2)
-        # self.ax2.set_xlim(start_date, start_date
-        #                   + self.half_period_length * 4)
-
-        # add the legends
-        self.leg_dict = {
-            'Live System': self.acl1,
-            'Model': self.m_line1,
-            'Model Threshold': self.model_error,
-        }
-        l = (self.leg_dict.values(), self.leg_dict.keys())
-        self.legend = self.fig.legend(*l, loc='upper center',
-                                        ncol=3, mode='expand')
-
-        # rotate tick labels for all subplots
-        self.fig.autofmt_xdate(bottom=0.2)
-
-        # prepare the canvas
-        self.prepare_canvas()
-
-        # setup animation
-        self.ani = animation.FuncAnimation(
-            fig=self.fig,
-            func=self.update,
-            frames=self.get_data,
-            interval=200,
-            blit=False,
-            )
-
-    def plot_model(self):
-        """Plot the static model data."""
-
-        # add upper and lower bounds w/ standard threshold
-        # TODO: make variable threshold possible
-        md = self.model_data[self.model_name]
-        self.model_data['upper_bound'] = md + self.args.threshold * md
-        self.model_data['lower_bound'] = md - self.args.threshold * md
-
-        # save a resampled version of the model data
-        self.rs_model = self.model_data.resample('W').mean()
-        rs_md = self.rs_model[self.model_name]
-
-        # model resampled
-        (self.m_line1, ) = self.ax1.plot(
-            rs_md.index,
-            rs_md.values,
-            c='green',
-            ls='solid',
-            lw=0.7,
-            alpha=0.7,
-            )
-
-        # plot the resampled model line
-        (self.m_line2, ) = self.ax2.plot(
-            rs_md.index,
-            rs_md.values,
-            c='green',
-            ls='solid',
-            lw=0.7,
-            alpha=0.7,
-            )
-
-        # plot the model threshold
-        self.model_error = self.ax1.fill_between(
-            rs_md.index,
-            # rs_md.values - self.args.threshold * rs_md.values,
-            # rs_md.values + self.args.threshold * rs_md.values,
-            rs_md.values - self.args.threshold * rs_md.values,
-            rs_md.values + self.args.threshold * rs_md.values,
-            alpha=0.3,
-            color='green',
-            linestyle=':',
-            )
 
     def prepare_canvas(self):
         """Prepare the Backend Canvas for drawing on it."""
-        self.canvas = FigureCanvas(self.fig)
+        self.canvas = FigureCanvas(self.dashboard.fig)
         self.canvas.setSizePolicy(QtWidgets.QSizePolicy.Expanding,
                                     QtWidgets.QSizePolicy.Expanding)
         self.canvas.updateGeometry()
@@ -241,215 +98,75 @@ class Plotter(QtWidgets.QApplication):
                 self.closeAllWindows()
             elif e.key == ' ':
                 # pause / unpause
-                self.paused = not self.paused
+                self.dashboard.paused = not self.dashboard.paused
 
         self.canvas.mpl_connect('key_press_event', keypress)
 
 
-    def get_data(self):
-        """Receive data from the inspector and yield to self.update."""
-        while True:
-            while self.paused:
-                yield None
+    def step(self):
+        """Draw the next frame of the animation."""
+        started = time.perf_counter()
+        views = self.dashboard.views()
+        self.dashboard.next_frame()
+
+        if self.dashboard.redraw or self.dashboard.views() != views:
+            self.dashboard.redraw = False
+            self.canvas.draw()
+        else:
+            self.blitter.blit()
+        self.adapt(time.perf_counter() - started)
 
-            new_data = []
-            fc = None
+    def adapt(self, seconds):
+        """Adapt the frame interval to the cost of drawing a frame.
 
-            while len(new_data) < 4:
-                try:
-                    obj = self.plotting_queue.get_nowait()
-                except Empty:
-                    break
+        The interval is chosen so that drawing takes up about frame_budget of
+        the time, based on a moving average of the cost of recent frames.
+        """
+        if self.frame_cost is None:
+            self.frame_cost = seconds
+        self.frame_cost += 0.2 * (seconds - self.frame_cost)
 
-                if isinstance(obj, dict):
-                    new_data.append(obj)
-                else:
-                    # object is a new forecast
-                    fc = obj
-                    break
+        interval = 1000 * self.frame_cost / self.frame_budget
+        interval = int(min(max(interval, self.min_interval), self.max_interval))
+        if interval != self.timer.interval():
+            self.timer.setInterval(interval)
 
 
-            if len(new_data) > 0:
-                yield new_data
-                if fc is not None:
-                    yield fc
-            else:
-                yield fc
+class Blitter:
+    """Redraws animated artists on a cached background.
 
+    After each full redraw of the canvas, the background without the animated
+    artists is cached. A frame then only restores the background and draws
+    the animated artists on it, which is far cheaper than a full redraw. A
+    full redraw is needed whenever anything else changes, e.g. the axis limits.
 
-    def update(self, obj):
-        """Determine what object was received and update plot accordingly."""
-        if obj is None:
-            return self.artists
-        elif isinstance(obj, pd.DataFrame):
-            return self.plot_forecast(obj)
-        else:
-            return self.plot_actual(obj)
-
-
-    def plot_actual(self, rows):
-        """This function updates various plot elements.
-
-        It is called in regular interval during the animation loop and is
-        responsible for redrawing the lines and axes."""
-
-        # add new rows to plotting data
-        for row in rows:
-            for k, v in row.items():
-                self.data[k].append(v)
-
-        # last row is current date
-        date = rows[-1]['Index']
-
-        # resampled plot; iloc[:-1] cuts of the most recent week
-        self.resampled_actual = pd.Series(index=self.data['Index'],
-                    data=self.data[self.system_name]).resample('W').mean().iloc[:-1]
-
-        # set the new acutal data
-        self.acl1.set_data(self.resampled_actual.index, self.resampled_actual.values)
-        self.acl2.set_data(self.resampled_actual.index, self.resampled_actual.values)
-
-        # get current upper bound of date axis
-        ax1_right_lim = matplotlib.dates.num2date(self.ax1.get_xlim()[1])
-
-        # calculate center and remove timezone information for comparison
-        ax1_center = ax1_right_lim - self.half_period_length
-        ax1_center = ax1_center.replace(tzinfo=None)
-
-        # set the new x_axis limits
-        if date > ax1_center:
-            self.ax1.set_xlim(date - self.half_period_length, date
-                              + self.half_period_length)
-
-        # plot model-actual errors
-        self.plot_model_actual_deviation()
-
-        # adjust y-axis
-        self.ax1.relim(visible_only=True)
-        self.ax2.relim(visible_only=True)
-        self.ax1.autoscale_view(tight=None, scalex=False, scaley=True)
-        self.ax2.autoscale_view(tight=None, scalex=False, scaley=True)
-
-        # return all artists that need to be redrawn
-        return self.artists
-
-
-
-    def plot_forecast(self, fc):
-        """Draw a new forecast."""
-
-        # get resampled model data for forecast period
-        rs_m = self.rs_model.loc[fc.index, self.model_name]
-
-        # draw forecast confidence interval
-        self.fc_error = self.ax2.fill_between(
-            fc.index,
-            fc['yhat_lower'],
-            fc['yhat_upper'],
-            alpha=0.2,
-            color='orange',
-            linestyle=':',
-            )
-
-        # draw deviation between forecast and model
-        # below
-        self.dev_warn_below = self.ax2.fill_between(
-            fc.index,
-            fc['yhat_lower'],
-            rs_m.values,
-            where=rs_m.values < fc['yhat_lower'],
-            interpolate=True,
-            alpha=0.2,
-            color='fuchsia',
-            linestyle=':',
-            )
-
-        # above
-        self.dev_warn_above = self.ax2.fill_between(
-            fc.index,
-            fc['yhat_upper'],
-            rs_m.values,
-            where=rs_m.values > fc['yhat_upper'],
-            interpolate=True,
-            alpha=0.2,
-            color='fuchsia',
-            linestyle=':',
-            )
-
-        # draw forecast line
-        (fc_line, ) = self.ax2.plot(
-                fc.index,
-                fc['yhat'],
-                c='black',
-                ls='dashed',
-                lw=0.5,
-                alpha=0.4,
-                )
-
-        self.fc_lines.append(fc_line)
-
-        if len(self.fc_lines) is 1:
-            # update legend the first time a forecast is drawn
-            d = {'Forecast \u00B1 CI': (self.fc_lines[-1], self.fc_error), 'Model-Forecast Deviation': self.dev_warn_above}
-            self.leg_dict.update(d)
-            l = (self.leg_dict.values(), self.leg_dict.keys())
-
-            self.legend.remove()
-            self.legend = self.fig.legend(*l, loc='upper center',
-                                            ncol=3, mode='expand')
-
-        return self.artists
-
-
-    def plot_model_actual_deviation(self):
-        """Draw the deviation between the model and the actual system."""
-
-        # get resmapled index & upper/lower bounds of model line
-        idx = self.resampled_actual.index
-        ml_upper = self.rs_model.loc[idx, 'upper_bound']
-        ml_lower = self.rs_model.loc[idx, 'lower_bound']
-        ac = self.resampled_actual.values
-
-        # We cannot update a PolyCollection so we need to delete the old
-        # deviation patches and draw a new one.
-        try:
-            self.actual_dev_below.remove()
-            self.actual_dev_above.remove()
-        except AttributeError:
-            self.update_legend = True
-            pass
-
-        # draw deviations below
-        self.actual_dev_below = self.ax1.fill_between(
-            idx,
-            ml_lower,
-            ac,
-            where=ac < ml_lower,
-            interpolate=True,
-            alpha=0.3,
-            color='red',
-            linestyle=':',
-            )
-
-        # and above
-        self.actual_dev_above = self.ax1.fill_between(
-            idx,
-            ml_upper,
-            ac,
-            where=ac > ml_upper,
-            interpolate=True,
-            alpha=0.3,
-            color='red',
-            linestyle=':',
-            )
-
-        # update the legend when necessary
-        if self.update_legend:
-            self.update_legend = False
-            d = {'Model-System Deviation': self.actual_dev_below}
-            self.leg_dict.update(d)
-            l = (self.leg_dict.values(), self.leg_dict.keys())
-
-            self.legend.remove()
-            self.legend = self.fig.legend(*l, loc='upper center',
-                                            ncol=3, mode='expand')
+    Attributes:
+        canvas (FigureCanvas): the canvas to draw on.
+        artists (list): the animated artists.
+        background: the cached background, if any.
+    """
+    def __init__(self, canvas, artists):
+        self.canvas = canvas
+        self.artists = artists
+        self.background = None
+        for artist in artists:
+            artist.set_animated(True)
+        canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        """Cache the background after a full redraw and draw the artists."""
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        for artist in self.artists:
+            self.canvas.figure.draw_artist(artist)
+
+    def blit(self):
+        """Draw a frame with the current state of the animated artists."""
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
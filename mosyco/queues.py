@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the bounded queues between the components of mosyco.
+
+An unbounded queue grows without limit whenever its consumer falls behind,
+e.g. while the inspector waits for a forecast or the GUI is busy drawing. The
+queues in this module hold at most a fixed number of items. What happens to a
+new item while the queue is full depends on the overflow policy:
+
+    block
+        wait until the consumer has taken an item (backpressure).
+    drop-oldest
+        remove the oldest waiting item to make room for the new one.
+    coalesce
+        keep only the latest of the items that did not fit. It is put as soon
+        as the queue has room again.
+
+The end-of-stream sentinel None is never dropped or coalesced. Queues that do
+not end with None have to be finished instead, so that a coalesced item is not
+lost.
+"""
+import logging
+from queue import Empty, Full
+
+log = logging.getLogger(__name__)
+
+policies = ['block', 'drop-oldest', 'coalesce']
+
+
+class OverflowQueue:
+    """A bounded queue with an overflow policy.
+
+    The OverflowQueue wraps a queue.Queue or multiprocessing.Queue and takes
+    over its put method. All other methods (get, get_nowait, empty, ...) are
+    passed to the wrapped queue. The counters only count the items of the
+    producer's process.
+
+    Attributes:
+        queue: the wrapped queue, which should have a maxsize.
+        policy (str): the overflow policy, one of policies.
+        dropped (int): number of items dropped because the queue was full.
+        coalesced (int): number of items replaced by a later item.
+    """
+    def __init__(self, queue, policy='block'):
+        if policy not in policies:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.queue = queue
+        self.policy = policy
+        self.dropped = 0
+        self.coalesced = 0
+        # holds the latest coalesced item, if any
+        self._pending = []
+
+    def __getattr__(self, name):
+        # special attributes are looked up before unpickling has set queue
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.queue, name)
+
+    def put(self, item):
+        """Put an item into the queue, according to the overflow policy."""
+        if item is None or self.policy == 'block':
+            self.flush(block=True)
+            self.queue.put(item)
+        elif self.policy == 'drop-oldest':
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except Empty:
+                        # the consumer has just taken the last item
+                        pass
+        else:
+            self.flush()
+            if self._pending:
+                self.coalesced += 1
+                self._pending[0] = item
+            else:
+                try:
+                    self.queue.put_nowait(item)
+                except Full:
+                    self._pending.append(item)
+
+    def flush(self, block=False):
+        """Put the latest coalesced item, if any and the queue has room."""
+        if not self._pending:
+            return
+        try:
+            self.queue.put(self._pending[0], block)
+            self._pending.clear()
+        except Full:
+            pass
+
+    def finish(self):
+        """Put the latest coalesced item, waiting for room if necessary.
+
+        Putting None finishes the queue as well.
+        """
+        self.flush(block=True)
+
+    def report(self, name):
+        """Log the counters of the queue if any item was lost."""
+        if self.dropped or self.coalesced:
+            log.info(f'{name} queue: {self.dropped} items dropped, '
+                     f'{self.coalesced} items coalesced.')
@@ -6,10 +6,30 @@ observed as well as simulated values to the inspector for analysis.
 import logging
 import threading
 import time
+from collections import namedtuple
+
+import numpy as np
+
 import mosyco.helpers as helpers
 
 log = logging.getLogger(__name__)
 
+
+Block = namedtuple('Block', ['index', 'values', 'columns', 'source', 'seq',
+                             'sent'])
+Block.__new__.__defaults__ = (None, 0, None)
+Block.__doc__ = """A contiguous block of observed system data.
+
+Attributes:
+    index (ndarray): datetime64 dates of the rows in this block.
+    values (ndarray): float64 array of shape (rows, columns).
+    columns (tuple): names of the system columns in ``values``.
+    source (str): name of the source that sent the block.
+    seq (int): sequence number of the block within its source.
+    sent (float): time at which the source sent the block.
+"""
+
+
 class Reader(threading.Thread):
     """The Reader class serves as an interface to system and model components.
 
@@ -17,22 +37,55 @@ class Reader(threading.Thread):
     This data is transferred to the Inspector for further analysis. The Reader is
     run as a separate thread.
 
+    Rows are sent to the Inspector in blocks of up to ``batch_size`` rows. A
+    block is flushed early if ``flush_interval`` seconds have passed since the
+    previous flush. Each row is assumed to take ``delay`` seconds to arrive; with
+    a delay of zero the data is replayed at memory speed.
+
+    If a ``chunk_size`` is given, the Reader does not load the data up front.
+    Instead, it streams the system columns from the source file in chunks of
+    ``chunk_size`` rows and sends the blocks of each chunk as soon as it is
+    parsed, so that its memory use does not depend on the size of the file.
+
     Attributes:
-        df (DataFrame): Simulates data sources of running systems and models.
+        name (str): name of the source, e.g. its file.
+        df (DataFrame): Simulates data sources of running systems. None if
+            the data is streamed.
         systems (dict): keys: system names, values: generators for live system data.
         queue (Queue): to communicate with the inspector across threads.
+        batch_size (int): maximum number of rows per block.
+        flush_interval (float): maximum number of seconds between two blocks.
+        delay (float): simulated arrival time of a single row in seconds.
+        chunk_size (int): number of rows to parse at once when streaming.
+        path (str): path of the source file.
     """
-    def __init__(self, sources, queue):
+    def __init__(self, sources, queue, batch_size=1, flush_interval=0.1,
+                 delay=0.001, chunk_size=None, path=helpers.data_file):
         """Return a new Reader object.
 
         Args:
             sources (list): list of column name strings for actual value data
+            queue (Queue): queue to which the blocks are pushed
+            batch_size (int): maximum number of rows per block
+            flush_interval (float): seconds after which a block is flushed
+            delay (float): seconds to wait between two rows
+            chunk_size (int): stream the data in chunks of this many rows
+            path (str): path of the source file
         """
         # For now we pretend that these values come from a system:
         super().__init__(daemon=True)
-        self.df = helpers.load_dataframe()
+        self.name = path
+        self.path = path
+        if chunk_size is None:
+            self.df = helpers.load_dataframe(sources, path)
+        else:
+            self.df = None
         self.queue = queue
         self.systems = sources
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.delay = delay
+        self.chunk_size = chunk_size
 
         log.info("Initialized reader...")
 
@@ -40,10 +93,58 @@ class Reader(threading.Thread):
     def run(self):
         """Run the Reader Thread."""
         log.debug("Reader has started sending data to queue...")
-        frame = self.df.loc[:, self.systems]
-        for entry in frame.itertuples():
-            self.queue.put(entry)
-            time.sleep(0.001)
+        columns = tuple(self.systems)
+
+        seq = 0
+        for (index, values) in self.chunks():
+            for start, stop in self._blocks(len(index)):
+                self.queue.put(Block(index[start:stop], values[start:stop],
+                                     columns, self.name, seq, time.time()))
+                seq += 1
+
         # signal that reader is done
         self.queue.put(None)
         log.info("The Reader has finished and is now idle.")
+
+    def chunks(self):
+        """Yield (index, values) arrays of the system data.
+
+        The loaded data is yielded as a single chunk. Streamed data is
+        yielded chunk by chunk, as it is parsed.
+        """
+        if self.chunk_size is None:
+            frames = [self.df.loc[:, self.systems]]
+        else:
+            frames = helpers.stream_dataframe(self.systems, self.chunk_size,
+                                              self.path)
+
+        for frame in frames:
+            yield (frame.index.values,
+                   np.asarray(frame[self.systems].values, dtype=np.float64))
+
+    def _blocks(self, length):
+        """Yield (start, stop) positions of the blocks to send.
+
+        Without a delay the rows are cut into blocks of ``batch_size`` rows.
+        Otherwise every row is awaited and a block is flushed as soon as it is
+        full or ``flush_interval`` seconds have passed.
+        """
+        if not self.delay:
+            for start in range(0, length, self.batch_size):
+                yield start, min(start + self.batch_size, length)
+            return
+
+        start = 0
+        flushed = time.monotonic()
+        for pos in range(length):
+            # wait for the next row to arrive
+            time.sleep(self.delay)
+            now = time.monotonic()
+            if (pos + 1 - start >= self.batch_size
+                    or now - flushed >= self.flush_interval):
+                yield start, pos + 1
+                start = pos + 1
+                flushed = now
+
+        if start < length:
+            yield start, length
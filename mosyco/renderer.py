@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+This module renders the Mosyco plots to disk, without a display.
+
+In headless mode, the same Dashboard as in GUI-mode draws the data, but onto
+an Agg canvas instead of a Qt window. The Renderer writes the figure either as
+numbered PNG snapshots into a directory or as an animation, which is encoded
+by one of matplotlib's animation writers.
+
+The reader and the inspector run in a process of their own, just like in
+GUI-mode. They write their data into shared memory without ever waiting for
+the Renderer, so rendering does not slow down the inspection.
+"""
+from matplotlib import animation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import logging
+import multiprocessing as mp
+import os
+import time
+
+from mosyco.dashboard import Dashboard, run_mosyco
+
+log = logging.getLogger(__name__)
+
+# animation writers for each file extension, in order of preference; any
+# other path is a directory of snapshots
+writers = {'.gif': ['pillow', 'imagemagick'], '.mp4': ['ffmpeg'],
+           '.mkv': ['ffmpeg'], '.webm': ['ffmpeg'], '.avi': ['ffmpeg'],
+           '.mov': ['ffmpeg']}
+
+
+class Renderer:
+    """The Renderer writes the Mosyco plots to disk during a run.
+
+    Every interval seconds, the Renderer receives the data that has arrived
+    since the previous frame and renders a new frame. Frames without new data
+    are skipped. Once the inspector has finished, the remaining data is
+    rendered and the Renderer returns.
+
+    Attributes:
+        args: Command Line Arguments
+        plot_channel: PlotChannel used for communicating with Inspector
+        dashboard: Dashboard that draws the plots
+        canvas: Agg canvas of the dashboard's figure
+        path: Directory of the snapshots or file name of the animation
+        interval: Seconds between two frames
+        writer: matplotlib animation writer, or None for PNG snapshots
+        frame: Number of frames rendered so far
+        process: Process running the reader and the inspector
+    """
+    def __init__(self, args, plot_channel):
+        self.args = args
+        self.plot_channel = plot_channel
+        self.path = args.render
+        self.interval = args.render_interval
+        self.dashboard = Dashboard(args, plot_channel)
+        self.canvas = FigureCanvasAgg(self.dashboard.fig)
+        self.writer = create_writer(self.path, 1 / self.interval)
+        self.frame = 0
+
+    def run(self):
+        """Run the Renderer until the inspector has finished."""
+        # the process is not a daemon, because the inspector starts its own
+        # forecasting processes
+        self.process = mp.Process(target=run_mosyco, args=(self.args, self.plot_channel))
+        self.process.start()
+
+        if self.writer is None:
+            os.makedirs(self.path, exist_ok=True)
+        else:
+            self.writer.setup(self.dashboard.fig, self.path)
+
+        try:
+            while True:
+                started = time.monotonic()
+                # check before receiving, so that no data is left afterwards
+                finished = not self.process.is_alive()
+                if self.dashboard.next_frame():
+                    self.render()
+                elif finished:
+                    break
+                time.sleep(max(0, started + self.interval - time.monotonic()))
+        finally:
+            self.process.terminate()
+            self.process.join()
+            if self.writer is not None:
+                self.writer.finish()
+
+        log.info(f'Rendered {self.frame} frames to {self.path}.')
+        if self.plot_channel.rows.lost:
+            log.info(f'The renderer skipped {self.plot_channel.rows.lost} rows '
+                     'it could not keep up with.')
+
+    def render(self):
+        """Write the current state of the dashboard as the next frame."""
+        if self.writer is None:
+            name = os.path.join(self.path, f'mosyco-{self.frame:05d}.png')
+            self.dashboard.fig.savefig(name)
+        else:
+            self.writer.grab_frame()
+        self.dashboard.redraw = False
+        self.frame += 1
+
+
+def create_writer(path, fps):
+    """Return the animation writer for path, or None if it is a directory.
+
+    Raises:
+        RuntimeError: if no writer for the file extension is available, e.g.
+            because ffmpeg is not installed.
+    """
+    names = writers.get(os.path.splitext(path)[1].lower())
+    if names is None:
+        return None
+    for name in names:
+        if animation.writers.is_available(name):
+            return animation.writers[name](fps=fps)
+    raise RuntimeError(f"Rendering {path} requires the {' or '.join(names)} "
+                       "writer, which is not available.")
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the shared memory data plane between inspector and plotter.
+
+In GUI-mode and headless mode, the inspector and the plotter run in separate
+processes. Instead of pickling every row and forecast onto a queue, the
+inspector writes them into ring buffers in shared memory, from which the
+plotter reads them through NumPy views without copying. Only small notifications about new forecasts are
+sent through the plotting queue.
+"""
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+
+# default number of rows held by a ring buffer
+default_capacity = 1 << 14
+
+
+class RingBuffer:
+    """A ring buffer of dated rows in shared memory.
+
+    The buffer has a single writer and a single reader, which may live in
+    different processes. The writer never waits for the reader: if the reader
+    falls behind by more than the capacity of the buffer, the oldest rows are
+    lost and counted.
+
+    Rows are numbered by their position in the stream of all written rows.
+    Only the number of written rows is shared; each process keeps track of
+    its own reading position.
+
+    Attributes:
+        capacity (int): maximum number of rows held by the buffer.
+        width (int): number of values per row.
+        dates (ndarray): datetime64 view on the dates in shared memory.
+        values (ndarray): float64 view on the values in shared memory.
+        position (int): position of the next row to read.
+        lost (int): number of rows overwritten before they were read.
+    """
+    def __init__(self, width, capacity=default_capacity):
+        """Create a new, empty RingBuffer.
+
+        Args:
+            width (int): number of values per row.
+            capacity (int): maximum number of rows held by the buffer.
+        """
+        self.capacity = capacity
+        self.width = width
+        self._dates = mp.RawArray('q', capacity)
+        self._values = mp.RawArray('d', capacity * width)
+        self._written = mp.RawValue('q', 0)
+        self.position = 0
+        self.lost = 0
+        self._views()
+
+    def _views(self):
+        """Create the NumPy views on the shared memory."""
+        self.dates = np.frombuffer(self._dates, dtype=np.int64).view('datetime64[ns]')
+        self.values = np.frombuffer(self._values).reshape(self.capacity, self.width)
+
+    def __getstate__(self):
+        # the views are recreated on the shared memory after unpickling
+        state = self.__dict__.copy()
+        del state['dates'], state['values']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._views()
+
+    @property
+    def written(self):
+        """Number of rows written so far."""
+        return self._written.value
+
+    def write(self, index, values):
+        """Append rows to the buffer.
+
+        Args:
+            index (ndarray): datetime64 dates of the rows.
+            values (ndarray): array of shape (len(index), width).
+
+        Returns:
+            The (start, stop) positions of the rows.
+        """
+        written = self._written.value
+        values = np.asarray(values, dtype=np.float64).reshape(len(index), self.width)
+        index = np.asarray(index, dtype='datetime64[ns]')
+
+        # only the most recent rows fit if there are too many
+        skip = max(0, len(index) - self.capacity)
+        for (start, stop) in self._segments(written + skip, written + len(index)):
+            offset = start - written
+            self.dates[start % self.capacity:][:stop - start] = index[offset:stop - written]
+            self.values[start % self.capacity:][:stop - start] = values[offset:stop - written]
+
+        # the rows are only published once they are completely written
+        self._written.value = written + len(index)
+        return (written, written + len(index))
+
+    def _segments(self, start, stop):
+        """Yield the (start, stop) positions of the contiguous parts of a range."""
+        while start < stop:
+            end = min(stop, start - start % self.capacity + self.capacity)
+            yield (start, end)
+            start = end
+
+    def read(self, limit=None):
+        """Return views on the unread rows and mark them as read.
+
+        At most the rows up to the end of the ring are returned at once, so
+        the buffer may need to be read twice to catch up. The views are only
+        valid until the writer wraps around, so the rows should be used or
+        copied right away.
+
+        Args:
+            limit (int): maximum number of rows to read.
+
+        Returns:
+            A tuple of the dates and the values of the rows.
+        """
+        written = self._written.value
+        if written - self.position > self.capacity:
+            self.lost += written - self.capacity - self.position
+            self.position = written - self.capacity
+
+        start = self.position % self.capacity
+        count = min(written - self.position, self.capacity - start)
+        if limit is not None:
+            count = min(count, limit)
+        self.position += count
+        return (self.dates[start:start + count], self.values[start:start + count])
+
+    def view(self, start, stop):
+        """Return a copy of the rows between two positions.
+
+        Returns:
+            A tuple of the dates and the values of the rows, or None if they
+            have already been overwritten.
+        """
+        if start < self._written.value - self.capacity:
+            return None
+        segments = list(self._segments(start, stop))
+        dates = np.concatenate([self.dates[a % self.capacity:][:b - a]
+                                for (a, b) in segments])
+        values = np.concatenate([self.values[a % self.capacity:][:b - a]
+                                 for (a, b) in segments])
+        return (dates, values)
+
+
+class PlotChannel:
+    """Sends the actual system data and the forecasts to the plotter.
+
+    The rows of the actual system data are written into a ring buffer, which
+    the plotter reads on each frame. Each forecast is written into a second
+    ring buffer, followed by a notification with its position on the queue.
+
+    Attributes:
+        queue (Queue): bounded queue for the notifications.
+        rows (RingBuffer): the actual system data.
+        forecasts (RingBuffer): the 'yhat', 'yhat_lower' and 'yhat_upper'
+            columns of the forecasts.
+    """
+    forecast_columns = ['yhat', 'yhat_lower', 'yhat_upper']
+
+    def __init__(self, queue, width=1, capacity=default_capacity):
+        self.queue = queue
+        self.rows = RingBuffer(width, capacity)
+        self.forecasts = RingBuffer(len(self.forecast_columns), capacity)
+
+    def send_rows(self, index, values):
+        """Write rows of actual system data."""
+        self.rows.write(index, values)
+
+    def send_forecast(self, forecast):
+        """Write a forecast and notify the plotter.
+
+        Args:
+            forecast (DataFrame): forecast with a DatetimeIndex.
+        """
+        positions = self.forecasts.write(forecast.index.values,
+                                         forecast[self.forecast_columns].values)
+        self.queue.put(positions)
+
+    def receive_rows(self, limit=None):
+        """Return views on the rows that have not been received yet.
+
+        See RingBuffer.read.
+        """
+        return self.rows.read(limit)
+
+    def receive_forecast(self, positions):
+        """Return the forecast of a notification as a DataFrame, or None."""
+        rows = self.forecasts.view(*positions)
+        if rows is None:
+            return None
+        (dates, values) = rows
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates),
+                            columns=self.forecast_columns)
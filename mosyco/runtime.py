@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains an asyncio based runtime for mosyco.
+
+By default, every source runs in a thread of its own. With hundreds of mostly
+idle live sources, that means hundreds of threads that do nothing but wait.
+The asyncio runtime runs the sources, the inspector and the dispatch of the
+forecasts as coroutines on a single event loop instead. They are connected by
+bounded asyncio queues, so that a source which is faster than the inspector is
+held back rather than filling up the memory (backpressure). The overflow
+policies of mosyco.queues do not apply to the asyncio runtime.
+
+CPU heavy work is kept off the event loop: the sample data is parsed by the
+loop's default thread pool and the forecasts are fit by the worker processes
+of an AsyncForecastPool.
+
+The runtime is selected with the '--runtime asyncio' command line option. It
+reads the same sources as the threads runtime, see mosyco.sources.
+"""
+import asyncio
+import functools
+import logging
+import math
+import time
+
+import numpy as np
+
+import mosyco.helpers as helpers
+from mosyco.cache import create_cache
+from mosyco.forecasting import AsyncForecastPool
+from mosyco.inspector import Inspector
+from mosyco.reader import Block, Reader
+from mosyco.sources import Merger, parse_line, parse_source
+
+log = logging.getLogger(__name__)
+
+
+async def replay(position, reader, inbox):
+    """Send the system data of a Reader, like the Reader thread does.
+
+    The chunks of data are parsed in the default thread pool. Instead of
+    waiting for each row, the replay sleeps once per block, for the time it
+    takes all of the block's rows to arrive.
+
+    Args:
+        position (int): position of the source, which tags its blocks.
+        reader (Reader): the reader, which is used but not started.
+        inbox (asyncio.Queue): queue to which the tagged blocks are pushed.
+    """
+    loop = asyncio.get_event_loop()
+    columns = tuple(reader.systems)
+    size = _rows_per_block(reader.batch_size, reader.flush_interval, reader.delay)
+
+    seq = 0
+    chunks = reader.chunks()
+    while True:
+        chunk = await loop.run_in_executor(None, next, chunks, None)
+        if chunk is None:
+            break
+
+        (index, values) = chunk
+        for start in range(0, len(index), size):
+            stop = min(start + size, len(index))
+            if reader.delay:
+                await asyncio.sleep(reader.delay * (stop - start))
+            await inbox.put((position, Block(index[start:stop], values[start:stop],
+                                             columns, reader.name, seq,
+                                             time.time())))
+            seq += 1
+
+    await inbox.put((position, None))
+    log.info(f"Source {reader.name} has finished.")
+
+def _rows_per_block(batch_size, flush_interval, delay):
+    """Return the number of rows in each block of a replay.
+
+    A block is flushed once it is full or flush_interval seconds have passed,
+    which takes flush_interval / delay rows.
+    """
+    if not delay:
+        return batch_size
+    return max(1, min(batch_size, math.ceil(flush_interval / delay)))
+
+async def read_lines(position, name, connect, systems, inbox, batch_size=1,
+                     flush_interval=0.1):
+    """Send the lines of system data from a stream, like a LineSource does.
+
+    Unlike a LineSource, an incomplete block is also sent when no new line
+    arrives within flush_interval seconds.
+
+    Args:
+        position (int): position of the source, which tags its blocks.
+        name (str): name of the source.
+        connect: coroutine function that returns an asyncio.StreamReader and
+            the StreamWriter of its connection, if any.
+        systems (list): names of the columns the source provides.
+        inbox (asyncio.Queue): queue to which the tagged blocks are pushed.
+        batch_size (int): maximum number of rows per block.
+        flush_interval (float): maximum number of seconds between two blocks.
+    """
+    columns = tuple(systems)
+    seq = 0
+    (dates, rows) = ([], [])
+
+    try:
+        (stream, writer) = await connect()
+        log.info(f"Source {name} is connected.")
+        flushed = time.monotonic()
+        while True:
+            timeout = None
+            if rows:
+                timeout = max(0, flushed + flush_interval - time.monotonic())
+            try:
+                line = await asyncio.wait_for(stream.readline(), timeout)
+            except asyncio.TimeoutError:
+                line = None
+            else:
+                if not line:
+                    break
+                try:
+                    (date, row) = parse_line(line.decode(), len(columns))
+                except ValueError:
+                    log.debug(f'Skipped line from {name}: {line!r}')
+                    continue
+                dates.append(date)
+                rows.append(row)
+
+            if (len(rows) >= batch_size
+                    or time.monotonic() - flushed >= flush_interval):
+                await inbox.put((position, Block(np.array(dates), np.array(rows),
+                                                 columns, name, seq, time.time())))
+                seq += 1
+                (dates, rows) = ([], [])
+                flushed = time.monotonic()
+
+        if writer is not None:
+            writer.close()
+    except OSError as e:
+        log.error(f"Source {name} failed: {e}")
+
+    if rows:
+        await inbox.put((position, Block(np.array(dates), np.array(rows),
+                                         columns, name, seq, time.time())))
+
+    # signal that the source is done
+    await inbox.put((position, None))
+    log.info(f"Source {name} has finished.")
+
+async def open_pipe(path):
+    """Return a StreamReader for a named pipe, and None."""
+    loop = asyncio.get_event_loop()
+    # opening a pipe blocks until the other end is opened for writing
+    pipe = await loop.run_in_executor(None, open, path, 'rb')
+    stream = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stream), pipe)
+    return (stream, None)
+
+async def open_socket(address):
+    """Return a StreamReader and StreamWriter for a TCP or UNIX domain socket.
+
+    The connection is closed once the writer is closed or garbage collected,
+    so the writer has to be kept until the stream has been read.
+    """
+    if isinstance(address, str):
+        return await asyncio.open_unix_connection(address)
+    return await asyncio.open_connection(*address)
+
+async def create_sources(args, inbox):
+    """Return the coroutines of the sources that send system data.
+
+    This is a replay of the sample data, or one coroutine per source if
+    sources are given. See mosyco.sources.create_reader.
+    """
+    loop = asyncio.get_event_loop()
+    options = {'batch_size': args.batch_size,
+               'flush_interval': args.flush_interval}
+
+    def reader(columns, **kwargs):
+        # loading the data is expensive, so it is done by the thread pool
+        return loop.run_in_executor(None, functools.partial(
+            Reader, columns, None, delay=args.delay, chunk_size=args.chunk_size,
+            **options, **kwargs))
+
+    if not args.sources:
+        return [replay(0, await reader(args.systems), inbox)]
+
+    sources = []
+    for (i, spec) in enumerate(args.sources):
+        (kind, target, columns) = parse_source(spec)
+        if kind == 'file':
+            sources.append(replay(i, await reader(columns, path=target), inbox))
+        elif kind == 'pipe':
+            sources.append(read_lines(i, f'pipe:{target}',
+                                      functools.partial(open_pipe, target),
+                                      columns, inbox, **options))
+        elif kind == 'unix':
+            sources.append(read_lines(i, f'unix:{target}',
+                                      functools.partial(open_socket, target),
+                                      columns, inbox, **options))
+        elif kind == 'tcp':
+            (host, port) = target.rsplit(':', 1)
+            sources.append(read_lines(i, f'tcp:{target}',
+                                      functools.partial(open_socket,
+                                                        (host, int(port))),
+                                      columns, inbox, **options))
+        else:
+            raise ValueError(f"Unknown source kind: {kind}")
+    return sources
+
+async def merge(sources, inbox, queue, capacity=64):
+    """Merge the tagged blocks of the sources into a single queue.
+
+    See mosyco.sources.FanIn.
+    """
+    merger = Merger(sources, capacity)
+    while merger.running:
+        (i, block) = await inbox.get()
+        for released in merger.push(i, block):
+            await queue.put(released)
+
+    # signal that all sources are done
+    await queue.put(None)
+    log.info("All sources have finished.")
+
+async def inspect(inspector, queue):
+    """Evaluate the blocks of the queue until it is done or the Inspector stops.
+
+    This is the asyncio counterpart of Inspector.start.
+    """
+    log.info("Starting Inspector...")
+    # silence suppresses stdout (to deal with pystan bug)
+    with helpers.silence():
+        running = True
+        while running:
+            block = await queue.get()
+            if block is None:
+                log.debug('The queue is empty. Shutting down Inspector...')
+                break
+            for part in inspector.ingest(block):
+                if not inspector.process(part):
+                    running = False
+                    break
+
+            # get does not suspend while blocks are waiting, so let the
+            # sources and the forecast dispatcher run between two blocks
+            await asyncio.sleep(0)
+
+        await inspector.pool.join()
+        inspector.finish()
+
+    log.info("The Inspector has finished!")
+
+async def main(args, model_data, plot_channel=None):
+    """Run the sources, the inspector and the forecast dispatcher.
+
+    Returns:
+        The Inspector, once it has finished.
+    """
+    # the queues always apply backpressure, regardless of the queue policy
+    queue = asyncio.Queue(maxsize=args.queue_size)
+    inbox = asyncio.Queue(maxsize=args.merge_buffer)
+
+    pool = AsyncForecastPool(args.workers, args.forecast_queue_size,
+                             args.forecaster, create_cache(args))
+    inspector = Inspector(model_data.index.copy(), model_data, args, None,
+                          plot_channel, pool=pool)
+
+    sources = await create_sources(args, inbox)
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in sources]
+    tasks.append(asyncio.ensure_future(
+        merge(len(sources), inbox, queue, args.merge_buffer)))
+    dispatcher = asyncio.ensure_future(pool.dispatch())
+
+    try:
+        await inspect(inspector, queue)
+        await dispatcher
+    finally:
+        # the sources may still be running if the inspector stopped early
+        for task in tasks + [dispatcher]:
+            task.cancel()
+        await asyncio.gather(*tasks, dispatcher, return_exceptions=True)
+    return inspector
+
+def run(args, model_data, plot_channel=None):
+    """Run mosyco on a new event loop until the inspector has finished.
+
+    Args:
+        args (Namespace): command line arguments.
+        model_data (DataFrame): the model data columns.
+        plot_channel (PlotChannel): sends the data to the plotter in GUI-mode or
+            headless mode.
+
+    Returns:
+        The Inspector, once it has finished.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(main(args, model_data, plot_channel))
+    finally:
+        loop.close()
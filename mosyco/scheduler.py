@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+This module decides when the inspector forecasts which system and period.
+
+Each forecast targets the period that follows the current one, e.g. the next
+year. How long that period is (the horizon) and how often it is forecast (the
+cadence) can be chosen on the command line:
+
+    period
+        forecast once at the end of each period, e.g. every December 31st
+        for the following year.
+    rows
+        forecast every N rows. The same period is forecast again and again as
+        new data arrives, and all of these vintages are kept.
+    drift
+        forecast a system whenever its rate of Model-Actual deviations rises
+        above a threshold, i.e. when the system starts to drift away from the
+        model.
+
+Fitting forecasts is expensive, so the Scheduler can also enforce a budget:
+the fits may take at most a number of seconds per second of wall-clock time on
+average, e.g. 0.5 keeps half a worker busy. Forecasts beyond the budget are
+skipped. The seconds of a fit are its duration, not the CPU time of the
+worker, which is not available with zero workers.
+"""
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+cadences = ['period', 'rows', 'drift']
+# pandas frequency of each forecast horizon
+horizons = {'year': 'A', 'quarter': 'Q', 'month': 'M', 'week': 'W'}
+
+day = np.timedelta64(1, 'D')
+
+
+def period_numbers(dates, freq):
+    """Return the number of the period of each date, counted from 1970.
+
+    This is much faster than converting the dates to pandas Periods.
+
+    Args:
+        dates (ndarray): datetime64 dates.
+        freq (str): pandas frequency of the periods, one of horizons' values.
+    """
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    if freq == 'A':
+        return dates.astype('datetime64[Y]').astype(np.int64)
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    if freq == 'Q':
+        return months // 3
+    if freq == 'M':
+        return months
+    # pandas' weeks end on Sundays, and 1970-01-01 was a Thursday
+    return (dates.astype('datetime64[D]').astype(np.int64) + 3) // 7
+
+
+def create_scheduler(args):
+    """Return the Scheduler selected on the command line."""
+    return Scheduler(args.systems, args.cadence, horizons[args.horizon],
+                     args.cadence_rows, args.drift_rate, args.drift_window,
+                     args.forecast_budget)
+
+
+class Scheduler:
+    """Schedules the forecasts of the inspector.
+
+    The inspector splits each block at the positions returned by cuts, so
+    that a forecast is always scheduled after the row that triggers it. After
+    evaluating a block, it passes the deviations to observe and asks which
+    forecasts are due.
+
+    Attributes:
+        cadence (str): when to forecast, one of cadences.
+        freq (str): pandas frequency of the forecast periods.
+        every (int): number of rows between two forecasts of the rows cadence.
+        drift_rate (float): deviation rate that triggers a drift forecast.
+        drift_window (int): number of rows the deviation rate is averaged over.
+        rates (dict): current deviation rate of each system.
+        budget (float): seconds of fitting the forecasts may take per second,
+            or None.
+        tokens (float): seconds of fitting left in the budget.
+        cost (float): moving average of the seconds of fitting a forecast, or
+            None before the first forecast has finished.
+        skipped (int): number of forecasts skipped to stay within the budget.
+    """
+    # forecasts need about a year of daily data for the yearly seasonality.
+    # Fit windows are at least as long, see mosyco.parser.min_fit_window, so
+    # the number of observed rows is the history of a forecast.
+    min_history = 365
+    # the budget can be saved up for at most this many seconds
+    burst = 60
+
+    def __init__(self, systems, cadence='period', freq='A', every=90,
+                 drift_rate=0.5, drift_window=30, budget=None):
+        if cadence not in cadences:
+            raise ValueError(f"Unknown cadence: {cadence}")
+        self.cadence = cadence
+        self.freq = freq
+        self.every = every
+        self.drift_rate = drift_rate
+        self.drift_window = drift_window
+        self.rates = dict.fromkeys(systems, 0.0)
+        # a system drifts once its rate rises above drift_rate, and again
+        # only after it has fallen back below it
+        self._armed = dict.fromkeys(systems, True)
+        self._drifting = set()
+
+        self.budget = budget
+        self.tokens = budget * self.burst if budget is not None else None
+        self.cost = None
+        self.skipped = 0
+        self._refilled = time.monotonic()
+        self._reserved = {}
+
+    def period_ends(self, dates):
+        """Return a boolean mask of the datetime64 dates that end a period."""
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        return (period_numbers(dates, self.freq)
+                != period_numbers(dates + day, self.freq))
+
+    def cuts(self, dates, cursor):
+        """Return the positions at which a block has to be split.
+
+        Args:
+            dates (ndarray): datetime64 dates of the block.
+            cursor (int): number of rows observed before the block.
+        """
+        # the forecasts are scored at the end of each period
+        cuts = np.flatnonzero(self.period_ends(dates)) + 1
+        if self.cadence == 'rows':
+            rows = cursor + np.arange(1, len(dates) + 1)
+            cuts = np.union1d(cuts, np.flatnonzero(rows % self.every == 0) + 1)
+        return cuts[cuts < len(dates)]
+
+    def observe(self, columns, exceeds):
+        """Update the deviation rates with the deviations of a block.
+
+        Args:
+            columns (tuple): names of the systems of the block.
+            exceeds (ndarray): boolean mask of the deviations exceeding the
+                threshold, one row per date and one column per system.
+        """
+        # exponential moving average of the mask, computed for all rows at once
+        alpha = 1 / self.drift_window
+        n = len(exceeds)
+        weights = alpha * (1 - alpha) ** np.arange(n - 1, -1, -1)
+        added = weights @ np.asarray(exceeds, dtype=np.float64)
+
+        for (system, rate) in zip(columns, added):
+            rate += self.rates[system] * (1 - alpha) ** n
+            self.rates[system] = rate
+            if rate <= self.drift_rate:
+                self._armed[system] = True
+            elif self._armed[system]:
+                self._armed[system] = False
+                self._drifting.add(system)
+
+    def ended(self, date):
+        """Return the period that ends at the datetime64 date, or None."""
+        if self.period_ends([date])[0]:
+            return pd.Period(date, self.freq)
+        return None
+
+    def due(self, date, cursor, systems, ended=None):
+        """Return the (system, period) forecasts that are due after a row.
+
+        The returned forecasts have been charged to the budget. If one of them
+        is not submitted after all, it has to be cancelled.
+
+        Args:
+            date (datetime64): date of the row.
+            cursor (int): number of rows observed including the row.
+            systems (tuple): names of the systems of the row.
+            ended (Period): the period that ends at date, if any, see ended.
+        """
+        if self.cadence == 'period':
+            triggered = systems if ended is not None else ()
+        elif self.cadence == 'rows':
+            triggered = systems if cursor % self.every == 0 else ()
+        else:
+            triggered = [system for system in systems if system in self._drifting]
+            self._drifting.difference_update(triggered)
+
+        if not len(triggered) or cursor < self.min_history:
+            return []
+
+        period = pd.Period(date, self.freq) + 1
+        forecasts = []
+        for system in triggered:
+            if self._charge(system, period):
+                forecasts.append((system, period))
+            else:
+                self.skipped += 1
+                log.debug(f'Skipped {system} forecast for {period} to stay '
+                          'within the budget.')
+        return forecasts
+
+    def _charge(self, system, period):
+        """Reserve the expected cost of a forecast if the budget allows it."""
+        if self.budget is None:
+            return True
+
+        now = time.monotonic()
+        self.tokens = min(self.budget * self.burst,
+                          self.tokens + (now - self._refilled) * self.budget)
+        self._refilled = now
+        cost = self.cost or 0.0
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        self._reserved.setdefault((system, period), []).append(cost)
+        return True
+
+    def _release(self, system, period):
+        """Return the cost reserved for the oldest forecast of a period."""
+        reserved = self._reserved.get((system, period))
+        if not reserved:
+            return 0.0
+        cost = reserved.pop(0)
+        if not reserved:
+            del self._reserved[(system, period)]
+        return cost
+
+    def cancel(self, system, period):
+        """Return the reserved cost of a forecast that was not submitted."""
+        if self.budget is not None:
+            self.tokens += self._release(system, period)
+
+    def spent(self, system, period, seconds):
+        """Charge the actual seconds of fitting a finished forecast."""
+        if self.cost is None:
+            self.cost = seconds
+        self.cost += 0.2 * (seconds - self.cost)
+        if self.budget is not None:
+            self.tokens += self._release(system, period) - seconds
+
+    def report(self):
+        """Log the number of forecasts skipped because of the budget."""
+        if self.skipped:
+            log.info(f'{self.skipped} forecasts skipped to stay within the '
+                     f'budget of {self.budget} seconds of fitting per second.')
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+This module spreads the observed systems across multiple processes.
+
+A single Inspector evaluates all systems in one Python process, so its
+throughput is limited to a single core. In sharded mode, the system/model
+pairs (or the live sources, if given) are partitioned across a number of
+shards. Each shard is a process of its own, which runs a complete Mosyco
+pipeline of reader and inspector for its part of the systems.
+
+The log records of all shards, which include the deviation alerts, are sent
+to the parent process and written to its log in a single stream. When a shard
+has finished, it sends the summary of its Inspector to the parent, which
+reports the aggregated results once all shards are done.
+"""
+import copy
+import logging
+import multiprocessing as mp
+import os
+from logging.handlers import QueueHandler, QueueListener
+from queue import Empty
+
+import numpy as np
+
+from mosyco.sources import parse_source
+
+log = logging.getLogger(__name__)
+
+# seconds to wait for a shard to exit once it has sent its summary
+join_timeout = 30
+
+
+def partition(args, shards):
+    """Return the command line arguments of each shard.
+
+    The live sources are distributed round-robin across the shards, along with
+    their systems and models. Without sources, the system/model pairs are
+    distributed instead. There are never more shards than sources or pairs.
+
+    If no number of forecasting workers is given, the CPUs are divided among
+    the shards.
+
+    Raises:
+        ValueError: if the systems and models do not pair up, or a source
+            provides a column that is not one of the systems.
+    """
+    if len(args.systems) != len(args.models):
+        raise ValueError(f"{len(args.systems)} systems but {len(args.models)} "
+                         "models given.")
+    model_map = dict(zip(args.systems, args.models))
+    if args.sources:
+        units = [([spec], parse_source(spec)[2]) for spec in args.sources]
+        for ([spec], columns) in units:
+            for column in columns:
+                if column not in model_map:
+                    raise ValueError(f"Source {spec} provides {column}, which "
+                                     "is not one of the systems.")
+    else:
+        units = [(None, [system]) for system in model_map]
+    shards = min(shards, len(units))
+
+    parts = []
+    for i in range(shards):
+        part = copy.copy(args)
+        part.shards = 1
+        part.sources = None
+        part.systems = []
+        for (sources, systems) in units[i::shards]:
+            if sources is not None:
+                part.sources = (part.sources or []) + sources
+            part.systems.extend(systems)
+        part.models = [model_map[system] for system in part.systems]
+        if args.workers is None:
+            part.workers = max(1, os.cpu_count() // shards)
+        parts.append(part)
+    return parts
+
+def run_shard(args, shard, records, results):
+    """Run the Mosyco pipeline of a shard.
+
+    This function is executed in the shard processes.
+
+    Args:
+        args (Namespace): command line arguments of the shard.
+        shard (int): number of the shard.
+        records (Queue): queue to which the log records are sent.
+        results (Queue): queue to which the summary of the Inspector is sent.
+    """
+    from mosyco import Mosyco
+
+    # send the log records to the parent, tagged with the shard
+    def tag(record):
+        record.name = f'{record.name}[{shard}]'
+        return True
+
+    handler = QueueHandler(records)
+    handler.addFilter(tag)
+    logging.getLogger().handlers = [handler]
+    logging.getLogger(__package__).setLevel(args.loglevel)
+    logging.getLogger('fbprophet').setLevel(logging.WARNING)
+
+    app = Mosyco(args)
+    app.run()
+    results.put((shard, app.inspector.summary()))
+
+def run(args):
+    """Run a shard process for each part of the systems and report the results.
+
+    Args:
+        args (Namespace): command line arguments, with the number of shards.
+    """
+    try:
+        parts = partition(args, args.shards)
+    except ValueError as e:
+        log.error(f'Could not partition the systems: {e}')
+        return
+
+    # spawn fresh processes, since they start forecasting processes of their own
+    context = mp.get_context('spawn')
+    records = context.Queue()
+    results = context.Queue()
+
+    # write the records of the shards with the handlers of this process
+    listener = QueueListener(records, *logging.getLogger().handlers,
+                             respect_handler_level=True)
+    listener.start()
+
+    processes = []
+    for (shard, part) in enumerate(parts):
+        log.info(f'Shard {shard} observes {", ".join(part.systems)}.')
+        process = context.Process(target=run_shard, name=f'shard-{shard}',
+                                  args=(part, shard, records, results))
+        process.start()
+        processes.append(process)
+
+    # collect the summaries, without waiting for shards that have failed
+    summaries = {}
+    failed = set()
+    while len(summaries) + len(failed) < len(processes):
+        # a shard's summary is sent before it exits, so a shard that had
+        # exited before the queue was found empty will not send one anymore
+        exited = [process.exitcode is not None for process in processes]
+        try:
+            (shard, summary) = results.get(timeout=1)
+            summaries[shard] = summary
+        except Empty:
+            for (shard, process) in enumerate(processes):
+                if exited[shard] and shard not in failed | set(summaries):
+                    log.error(f'Shard {shard} exited with code '
+                              f'{process.exitcode} without results.')
+                    failed.add(shard)
+
+    for (shard, process) in enumerate(processes):
+        process.join(join_timeout)
+        if process.is_alive():
+            log.error(f'Shard {shard} did not exit within {join_timeout}s '
+                      'and was terminated.')
+            process.terminate()
+            process.join()
+    listener.stop()
+
+    report(summaries.values())
+
+def report(summaries):
+    """Log the aggregated results of the shards."""
+    deviations = {}
+    alarms = {}
+    fit_stats = {}
+    for summary in summaries:
+        deviations.update(summary['deviations'])
+        alarms.update(summary['alarms'])
+        fit_stats.update(summary['fit_stats'])
+
+    for (system, count) in sorted(deviations.items()):
+        log.info(f'{system}: {count} Model-Actual deviations.')
+    for (system, count) in sorted(alarms.items()):
+        log.info(f'{system}: {count} drift alarms.')
+
+    if fit_stats:
+        seconds = [stats['seconds'] for stats in fit_stats.values()]
+        scores = [stats['mape'] for stats in fit_stats.values()
+                  if 'mape' in stats]
+        mape = f'{np.mean(scores):.2%}' if scores else 'n/a'
+        log.info(f'{len(seconds)} forecasts in all shards: '
+                 f'average fit {np.mean(seconds):.2f}s, average MAPE {mape}.')
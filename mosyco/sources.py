@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+This module lets the inspector observe multiple live sources at once.
+
+Each source runs in its own thread and sends blocks of system data, numbered
+per source and stamped with the time they were sent. The FanIn merges the
+blocks of all sources into the inspector's queue in date order.
+
+Sources are specified as 'kind:target:columns', for example:
+
+    file:data/sample_data.csv:PAseasonal,PAtrend
+        replay the columns of a CSV file, like the default reader.
+    pipe:/tmp/plant1:PAshift
+        read lines of 'date,value,...' from a named pipe (FIFO).
+    tcp:localhost:9000:PAcombi
+        read lines of 'date,value,...' from a TCP socket.
+    unix:/tmp/plant2.sock:PAtrend
+        read lines of 'date,value,...' from a UNIX domain socket.
+"""
+import heapq
+import logging
+import socket
+import threading
+import time
+from queue import Queue
+
+import numpy as np
+
+from mosyco.reader import Block, Reader
+
+log = logging.getLogger(__name__)
+
+
+def parse_line(line, width):
+    """Return the date and values of a line of 'date,value,...'.
+
+    Raise a ValueError if the line does not hold a date and width values.
+    """
+    (date, *values) = line.strip().split(',')
+    if len(values) != width:
+        raise ValueError(f'expected {width} values, got {len(values)}')
+    return (np.datetime64(date, 'ns'), [float(v) for v in values])
+
+
+class LineSource(threading.Thread):
+    """Reads lines of system data from a stream and sends them as blocks.
+
+    Each line holds a date followed by one value per column, separated by
+    commas. Lines that can not be parsed (e.g. a header) are skipped. Whenever
+    a line arrives, the current block is sent if it holds ``batch_size`` rows
+    or ``flush_interval`` seconds have passed since the previous block.
+
+    Subclasses implement _open, which returns the stream as a text file.
+
+    Attributes:
+        name (str): name of the source.
+        systems (list): names of the columns the source provides.
+        queue (Queue): queue to which the blocks are pushed.
+        batch_size (int): maximum number of rows per block.
+        flush_interval (float): maximum number of seconds between two blocks.
+    """
+    def __init__(self, name, systems, queue, batch_size=1, flush_interval=0.1):
+        super().__init__(daemon=True)
+        self.name = name
+        self.systems = systems
+        self.queue = queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+    def _open(self):
+        """Return the stream as a text file object."""
+        raise NotImplementedError
+
+    def run(self):
+        """Run the source thread."""
+        columns = tuple(self.systems)
+        seq = 0
+        (dates, rows) = ([], [])
+        flushed = time.monotonic()
+
+        try:
+            with self._open() as stream:
+                log.info(f"Source {self.name} is connected.")
+                for line in stream:
+                    try:
+                        (date, row) = parse_line(line, len(columns))
+                    except ValueError:
+                        log.debug(f'Skipped line from {self.name}: {line!r}')
+                        continue
+
+                    dates.append(date)
+                    rows.append(row)
+                    now = time.monotonic()
+                    if (len(rows) >= self.batch_size
+                            or now - flushed >= self.flush_interval):
+                        self.queue.put(Block(np.array(dates), np.array(rows),
+                                             columns, self.name, seq,
+                                             time.time()))
+                        seq += 1
+                        (dates, rows) = ([], [])
+                        flushed = now
+        except OSError as e:
+            log.error(f"Source {self.name} failed: {e}")
+        finally:
+            if rows:
+                self.queue.put(Block(np.array(dates), np.array(rows), columns,
+                                     self.name, seq, time.time()))
+
+            # signal that the source is done, even if it has failed
+            self.queue.put(None)
+            log.info(f"Source {self.name} has finished.")
+
+
+class PipeSource(LineSource):
+    """Reads system data from a named pipe (or any other file)."""
+    def __init__(self, path, systems, queue, **options):
+        super().__init__(f'pipe:{path}', systems, queue, **options)
+        self.path = path
+
+    def _open(self):
+        return open(self.path)
+
+
+class SocketSource(LineSource):
+    """Reads system data from a TCP or UNIX domain socket.
+
+    Attributes:
+        address: (host, port) tuple of a TCP socket or path of a UNIX socket.
+    """
+    def __init__(self, address, systems, queue, **options):
+        if isinstance(address, str):
+            name = f'unix:{address}'
+        else:
+            name = 'tcp:{}:{}'.format(*address)
+        super().__init__(name, systems, queue, **options)
+        self.address = address
+
+    def _open(self):
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.address)
+        else:
+            sock = socket.create_connection(self.address)
+        # the file keeps the connection open until the file itself is closed
+        with sock:
+            return sock.makefile('r')
+
+
+class _Inbox:
+    """Queue adapter that tags everything a source puts with its position."""
+    def __init__(self, queue, position):
+        self.queue = queue
+        self.position = position
+
+    def put(self, item):
+        self.queue.put((self.position, item))
+
+
+class Merger:
+    """Merges the blocks of several sources in date order.
+
+    The Merger buffers up to ``capacity`` blocks and releases them in the order
+    of their first date: a block is released once every running source has a
+    block in the buffer, or when the buffer is full. Blocks that arrive too
+    late for their position are released as soon as possible.
+
+    The sequence number of each block is checked against the previous block
+    of its source, in order to detect lost or reordered blocks.
+
+    Attributes:
+        running (set): positions of the sources that have not finished yet.
+        capacity (int): maximum number of buffered blocks.
+    """
+    def __init__(self, sources, capacity=64):
+        """Create a new Merger for the given number of sources."""
+        self.running = set(range(sources))
+        self.capacity = capacity
+        self._expected = [0] * sources
+        self._buffered = [0] * sources
+        self._heap = []
+
+    def push(self, i, block):
+        """Add a block from the i-th source and return the released blocks.
+
+        A block of None signals that the source has finished.
+        """
+        if block is None:
+            self.running.discard(i)
+        else:
+            if block.seq != self._expected[i]:
+                log.warning(f'Source {block.source} sent block {block.seq}, '
+                            f'expected block {self._expected[i]}.')
+            self._expected[i] = block.seq + 1
+            self._buffered[i] += 1
+            heapq.heappush(self._heap, (block.index[0], i, block.seq, block))
+
+        released = []
+        while self._heap and (len(self._heap) > self.capacity
+                              or all(self._buffered[j] for j in self.running)):
+            (_, j, _, block) = heapq.heappop(self._heap)
+            self._buffered[j] -= 1
+            released.append(block)
+        return released
+
+
+class FanIn(threading.Thread):
+    """Merges the blocks of many concurrent sources into a single queue.
+
+    The sources run in their own threads and push their blocks to a shared
+    inbox. The blocks are merged in date order by a Merger.
+
+    Attributes:
+        sources (list): the source threads.
+        queue (Queue): queue to which the merged blocks are pushed.
+        capacity (int): maximum number of buffered blocks.
+    """
+    def __init__(self, sources, queue, capacity=64):
+        """Create a new FanIn.
+
+        Args:
+            sources (list): (cls, args, kwargs) tuples of the sources. Each
+                source is created with the inbox as its queue argument.
+            queue (Queue): queue to which the merged blocks are pushed.
+            capacity (int): maximum number of buffered blocks.
+        """
+        super().__init__(daemon=True)
+        self.inbox = Queue(maxsize=capacity)
+        self.queue = queue
+        self.capacity = capacity
+        self.sources = [cls(*args, queue=_Inbox(self.inbox, i), **kwargs)
+                        for (i, (cls, args, kwargs)) in enumerate(sources)]
+
+    def run(self):
+        """Start the sources and merge their blocks until all are done."""
+        for source in self.sources:
+            source.start()
+
+        merger = Merger(len(self.sources), self.capacity)
+        while merger.running:
+            (i, block) = self.inbox.get()
+            for released in merger.push(i, block):
+                self.queue.put(released)
+
+        # signal that all sources are done
+        self.queue.put(None)
+        log.info("All sources have finished.")
+
+
+def parse_source(spec):
+    """Return the (kind, target, columns) of a source specification."""
+    (kind, rest) = spec.split(':', 1)
+    (target, columns) = rest.rsplit(':', 1)
+    return (kind, target, columns.split(','))
+
+def create_reader(args, queue):
+    """Return the thread that sends the system data to the inspector.
+
+    This is a Reader for the sample data, or a FanIn if sources are given.
+    """
+    options = {'batch_size': args.batch_size,
+               'flush_interval': args.flush_interval}
+
+    if not args.sources:
+        return Reader(args.systems, queue, delay=args.delay,
+                      chunk_size=args.chunk_size, **options)
+
+    sources = []
+    for spec in args.sources:
+        (kind, target, columns) = parse_source(spec)
+        if kind == 'file':
+            sources.append((Reader, (columns,),
+                            dict(delay=args.delay, chunk_size=args.chunk_size,
+                                 path=target, **options)))
+        elif kind == 'pipe':
+            sources.append((PipeSource, (target, columns), options))
+        elif kind == 'unix':
+            sources.append((SocketSource, (target, columns), options))
+        elif kind == 'tcp':
+            (host, port) = target.rsplit(':', 1)
+            sources.append((SocketSource, ((host, int(port)), columns), options))
+        else:
+            raise ValueError(f"Unknown source kind: {kind}")
+
+    return FanIn(sources, queue, args.merge_buffer)
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the array-backed data stores used by the inspector and
+the plotter.
+
+The stores preallocate their memory, so that new data can be written without
+any reallocation or pandas indexing overhead. Pandas objects are only created
+on demand, as views on the underlying arrays.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+
+class StateStore:
+    """Preallocated storage for model and actual system data.
+
+    All columns share a single float64 array with one row per date of the
+    index. Rows are appended at the write cursor, which marks the end of the
+    observed data. Model columns are usually filled completely when the store
+    is created, whereas the actual system columns are appended block by block.
+
+    Attributes:
+        index (ndarray): datetime64 dates of all rows.
+        columns (list): names of the columns.
+        values (ndarray): float64 array of shape (len(index), len(columns)).
+        cursor (int): number of rows that have been observed so far.
+    """
+    def __init__(self, index, columns):
+        """Create a new, empty StateStore.
+
+        Args:
+            index (DatetimeIndex or ndarray): dates of all rows.
+            columns (list): column names. Duplicate names are stored once.
+        """
+        self.index = np.asarray(index, dtype='datetime64[ns]')
+        self.columns = list(dict.fromkeys(columns))
+        self._positions = {name: i for i, name in enumerate(self.columns)}
+        self.values = np.full((len(self.index), len(self.columns)), np.nan)
+        self.cursor = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def get_indexer(self, columns):
+        """Return the positions of the given column names."""
+        return [self._positions[name] for name in columns]
+
+    def position(self, date):
+        """Return the position of date in the index.
+
+        Raises:
+            KeyError: if date is not in the index.
+        """
+        date = np.datetime64(date, 'ns')
+        pos = int(np.searchsorted(self.index, date))
+        if pos >= len(self.index) or self.index[pos] != date:
+            raise KeyError(f"Date {date} is not in the index.")
+        return pos
+
+    def locate(self, start, end):
+        """Return the (start, stop) positions of all rows between two dates."""
+        return (int(np.searchsorted(self.index, np.datetime64(start, 'ns'))),
+                int(np.searchsorted(self.index, np.datetime64(end, 'ns'),
+                                    side='right')))
+
+    def set_column(self, name, values):
+        """Fill an entire column, e.g. with model data."""
+        self.values[:, self._positions[name]] = values
+
+    def append(self, index, values, columns):
+        """Write a block of rows for the given columns.
+
+        The block is written at the write cursor if it continues the observed
+        data, which is the usual case. Otherwise its position is looked up.
+
+        Args:
+            index (ndarray): datetime64 dates of the rows.
+            values (ndarray): array of shape (len(index), len(columns)).
+            columns (sequence): names of the columns in values.
+
+        Returns:
+            The (start, stop) positions the block was written to.
+
+        Raises:
+            KeyError: if the dates are not consecutive dates of the index.
+        """
+        start = self.cursor
+        if start >= len(self.index) or self.index[start] != index[0]:
+            start = self.position(index[0])
+        stop = start + len(index)
+        if not np.array_equal(self.index[start:stop], index):
+            raise KeyError(f"Dates from {index[0]} to {index[-1]} are not "
+                           "consecutive dates of the index.")
+
+        self.values[start:stop, self.get_indexer(columns)] = values
+        self.cursor = max(self.cursor, stop)
+        return (start, stop)
+
+    def column(self, name, start=None, stop=None):
+        """Return a view on a column between two positions."""
+        return self.values[start:stop, self._positions[name]]
+
+    def observed(self, name, start=0):
+        """Return views on the dates and values of a column's observed rows.
+
+        Args:
+            name (str): the column name.
+            start (int): position of the first row to return.
+
+        Returns:
+            A tuple of the index and the column, both ending at the cursor.
+        """
+        return (self.index[start:self.cursor],
+                self.values[start:self.cursor, self._positions[name]])
+
+    def frame(self, start=None, stop=None):
+        """Return a DataFrame view on the rows between two positions."""
+        return pd.DataFrame(self.values[start:stop],
+                            index=pd.DatetimeIndex(self.index[start:stop]),
+                            columns=self.columns,
+                            copy=False)
+
+
+Forecast = namedtuple('Forecast', ['start', 'stop', 'offset', 'observed'])
+Forecast.__doc__ = """A forecast vintage held by a ForecastStore.
+
+Attributes:
+    start (int): position of the first forecast date in the store's index.
+    stop (int): position after the last forecast date.
+    offset (int): row of the first forecast date in the store's values.
+    observed (int): number of observed rows the forecast was fit on.
+"""
+
+
+class ForecastStore:
+    """Append-only storage for the forecasts of each system and period.
+
+    The forecasts of all systems are appended to a single float64 array,
+    which grows by doubling, so that adding a forecast only copies the
+    forecast itself. Each forecast is located by the positions of its dates
+    in the shared index of the StateStore.
+
+    A (system, period) pair may be forecast more than once, e.g. with more
+    data. All of these vintages are kept in the order they were added, so
+    that their accuracy can be compared once the period has been observed.
+
+    Attributes:
+        index (ndarray): datetime64 dates shared with the StateStore.
+        columns (list): names of the forecast columns.
+    """
+    columns = ['yhat', 'yhat_lower', 'yhat_upper']
+
+    def __init__(self, index, capacity=1024):
+        """Create a new, empty ForecastStore.
+
+        Args:
+            index (DatetimeIndex or ndarray): dates of all rows.
+            capacity (int): number of forecast rows to allocate initially.
+        """
+        self.index = np.asarray(index, dtype='datetime64[ns]')
+        self._values = np.empty((capacity, len(self.columns)))
+        self._size = 0
+        self._forecasts = {}
+
+    def __len__(self):
+        """Number of forecasts, including all vintages."""
+        return sum(len(vintages) for vintages in self._forecasts.values())
+
+    def __contains__(self, key):
+        """Whether the (system, period) pair has been forecast."""
+        return key in self._forecasts
+
+    def add(self, system, period, forecast, observed=0):
+        """Add a new vintage of a forecast.
+
+        Args:
+            system (str): name of the actual system.
+            period (Period): the forecast period.
+            forecast (DataFrame): forecast indexed by consecutive dates of
+                the index, with (at least) the store's columns.
+            observed (int): number of observed rows the forecast was fit on.
+
+        Returns:
+            The new Forecast.
+
+        Raises:
+            ValueError: if the forecast's dates are not consecutive dates of
+                the index.
+        """
+        dates = np.asarray(forecast.index, dtype='datetime64[ns]')
+        start = int(np.searchsorted(self.index, dates[0])) if len(dates) else 0
+        stop = start + len(dates)
+        if not np.array_equal(self.index[start:stop], dates):
+            raise ValueError(f"Forecast dates of {system} for {period} "
+                             "do not match the index.")
+
+        if self._size + len(dates) > len(self._values):
+            capacity = max(2 * len(self._values), self._size + len(dates))
+            self._values = np.resize(self._values, (capacity, len(self.columns)))
+        self._values[self._size:self._size + len(dates)] = forecast[self.columns].values
+
+        vintage = Forecast(start, stop, self._size, observed)
+        self._size += len(dates)
+        self._forecasts.setdefault((system, period), []).append(vintage)
+        return vintage
+
+    def vintages(self, system, period):
+        """Return all Forecasts of a system and period, the latest last."""
+        return list(self._forecasts.get((system, period), []))
+
+    def get(self, system, period, vintage=-1):
+        """Return a Forecast of a system and period, by default the latest.
+
+        Raises:
+            KeyError: if the system and period have not been forecast.
+        """
+        try:
+            return self._forecasts[(system, period)][vintage]
+        except KeyError:
+            raise KeyError(f"No {system} forecast for {period}.")
+
+    def values(self, forecast):
+        """Return a view on the values of a Forecast, one row per date."""
+        return self._values[forecast.offset:
+                            forecast.offset + forecast.stop - forecast.start]
+
+    def column(self, forecast, name):
+        """Return a view on a column of a Forecast."""
+        return self.values(forecast)[:, self.columns.index(name)]
+
+    def frame(self, forecast):
+        """DataFrame view on a Forecast, indexed by its dates."""
+        return pd.DataFrame(self.values(forecast),
+                            index=pd.DatetimeIndex(self.index[forecast.start:forecast.stop]),
+                            columns=self.columns, copy=False)
+
+
+class WeeklyAggregator:
+    """Incremental weekly means of a stream of values.
+
+    The aggregator keeps the running sum and count of the current week. Once
+    a value of a later week arrives, the current week is closed and its mean is
+    appended to the closed weeks. Weeks end on Sunday and are labeled with
+    it, like the weeks of pandas' ``resample('W')``.
+
+    The closed weeks are stored in arrays that grow by doubling, so appending
+    a week is amortized constant time and never touches the earlier weeks.
+
+    Attributes:
+        index (ndarray): datetime64 labels of the closed weeks.
+        values (ndarray): float64 means of the closed weeks.
+        week (datetime64): label of the current, open week.
+    """
+    def __init__(self, capacity=64):
+        """Create a new, empty WeeklyAggregator.
+
+        Args:
+            capacity (int): number of weeks to allocate initially.
+        """
+        self._index = np.empty(capacity, dtype='datetime64[ns]')
+        self._values = np.empty(capacity)
+        self._size = 0
+        self.week = None
+        self._sum = 0.0
+        self._count = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def index(self):
+        return self._index[:self._size]
+
+    @property
+    def values(self):
+        return self._values[:self._size]
+
+    @staticmethod
+    def labels(dates):
+        """Return the week labels (the following Sunday) of datetime64 dates."""
+        days = np.asarray(dates, dtype='datetime64[D]')
+        # 1970-01-01 was a Thursday, so this makes Monday 0 and Sunday 6
+        weekday = (days.astype(np.int64) + 3) % 7
+        return (days + (6 - weekday)).astype('datetime64[ns]')
+
+    def add(self, dates, values):
+        """Add values in chronological order.
+
+        Args:
+            dates (ndarray): datetime64 dates of the values.
+            values (ndarray): the values.
+
+        Returns:
+            The number of weeks that were closed.
+        """
+        if not len(dates):
+            return 0
+        labels = self.labels(dates)
+        values = np.asarray(values, dtype=np.float64)
+
+        # sum up the values of each week in the batch at once
+        starts = np.r_[0, np.flatnonzero(labels[1:] != labels[:-1]) + 1]
+        sums = np.add.reduceat(values, starts)
+        counts = np.diff(np.r_[starts, len(values)])
+
+        closed = 0
+        for (label, total, count) in zip(labels[starts], sums, counts):
+            if self.week is not None and label != self.week:
+                self._append(self.week, self._sum / self._count)
+                closed += 1
+                (self._sum, self._count) = (0.0, 0)
+            self.week = label
+            self._sum += total
+            self._count += count
+        return closed
+
+    def _append(self, label, value):
+        """Append a closed week, growing the arrays if necessary."""
+        if self._size == len(self._index):
+            self._index = np.resize(self._index, 2 * self._size)
+            self._values = np.resize(self._values, 2 * self._size)
+        self._index[self._size] = label
+        self._values[self._size] = value
+        self._size += 1